@@ -1,238 +1,468 @@
+from rag_startup import STARTUP, Lazy, Warmup  # first, so the startup timing includes the imports
+import asyncio
 import os
-import pickle
-import faiss
-import gradio as gr
-import numpy as np
+import sys
 from pathlib import Path
-from sentence_transformers import SentenceTransformer
-from PyPDF2 import PdfReader
-from datetime import datetime
 import time
 import ollama
 import logging
+import multiprocessing
 import threading
-import re
+from concurrent.futures import ThreadPoolExecutor
+from bm25 import load_bm25, reciprocal_rank_fusion
+from chunker import SentenceChunker, tokenizer_counter
+from embedders import cache_name, load_embedder
+from embedding_cache import EmbeddingCache
+from query_batcher import MicroBatcher
+from query_cache import QueryCache
+from history_store import HistoryStore
+from metrics import REGISTRY, RequestTrace, cache_collector, cache_stats, serve
+from rag_async import GenerationGate, QueueFull, coalesce
+from rag_build import extract_text, update_store
+from rag_index import search_many
+from rag_prompt import chat_messages, log_generation_stats, pack_context
+from rag_serving import StoreWatcher, WorkerPool
+from rag_store import load_store, recover_store
+from reranker import Reranker
+# gradio, sentence_transformers and PyPDF2 are imported where they are first needed
+STARTUP.mark("imports")
 
 # ---------------- CONFIG ----------------
 MODEL_NAME = "llama3.2:3b"      # Ollama model name
 TOP_K = 3                  # number of docs to retrieve
-CHUNK_SIZE = 1000          # chars per chunk
-INDEX_FILE = "faiss_store_author.pkl"
-history_file = "app_history.txt"
+CHUNK_TOKENS = None        # embedder tokens per chunk (None = the embedder's max sequence length)
+CHUNK_OVERLAP_TOKENS = 24  # tokens of trailing sentences repeated at the start of the next chunk
+AUTHOR_PREFILTER = True    # restrict FAISS search to the author's chunks instead of post-filtering top 100
+INDEX_TYPE = "flat"        # flat | ivf_flat | ivf_pq | hnsw (see bench_ann.py for recall/latency)
+NPROBE = 16                # IVF lists probed per query
+EF_SEARCH = 64             # HNSW search depth
+INDEX_METRIC = "l2"        # "cosine" normalizes vectors and searches by inner product
+INDEX_CODEC = "float32"    # float32 | fp16 | int8 vector storage (2x / 4x smaller; see bench_ann.py)
+TEXT_CODEC = "raw"         # "zstd" compresses chunk text in blocks, decompressed only for hits
+HYBRID_SEARCH = True       # fuse BM25 keyword hits with the dense hits (reciprocal rank fusion)
+HYBRID_CANDIDATES = 20     # hits taken from each retriever before fusing down to TOP_K
+DENSE_WEIGHT = 1.0         # RRF weight of the embedding retriever
+BM25_WEIGHT = 1.0          # RRF weight of the keyword retriever
+RRF_K = 60                 # RRF rank constant; larger flattens the rank differences
+RERANK_MODEL = None        # e.g. "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1" to rerank candidates
+RERANK_CANDIDATES = 20     # candidates scored by the cross-encoder before keeping TOP_K
+RERANK_BUDGET_MS = 250     # rerank only as many uncached candidates as fit in this time
+INGEST_WORKERS = None      # PDF extraction processes (None = one per CPU)
+EMBED_BATCH_SIZE = 256     # chunks per embedding batch while building
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+EMBED_BACKEND = "torch"    # "torch" (fp32), "onnx" or "onnx_int8"; check with python embedders.py first
+EMBED_THREADS = None       # intra-op threads for the embedder (None = library default)
+EMBED_CACHE_DIR = "embedding_cache"   # (model, chunk hash) -> vector, reused across rebuilds
+EMBED_CACHE_MAX_ENTRIES = 2_000_000
+QUERY_CACHE_SIZE = 4096    # LRU entries per query cache tier
+QUERY_CACHE_TTL = 3600     # seconds
+ANSWER_CACHE_THRESHOLD = None   # e.g. 0.97 to replay answers to near-identical questions (cosine)
+QUERY_BATCH_SIZE = 32      # max concurrent questions embedded/searched together
+QUERY_BATCH_WAIT_MS = 2    # how long the batcher waits for more questions to arrive
+MAX_CONCURRENT_GENERATIONS = 2   # Ollama generations in flight; the rest wait in a FIFO queue
+MAX_QUEUED_GENERATIONS = 50      # beyond this new questions are turned away
+UI_CONCURRENCY = 64              # Gradio events handled at once (cheap: they are coroutines)
+CONTEXT_TOKENS = 1200      # retrieved text packed into the prompt (embedder tokens, approximate for the LLM)
+OLLAMA_KEEP_ALIVE = "30m"  # keep the model loaded between questions
+NUM_CTX = 4096             # Ollama context window
+NUM_PREDICT = -1           # max answer tokens (-1 = unlimited; a cap cuts long answers short)
+STREAM_FLUSH_MS = 50       # streamed tokens are sent to the UI in one update at most this often...
+STREAM_FLUSH_TOKENS = 20   # ...or once this many are buffered (1 = an update per token)
+INDEX_FILE = "faiss_store_author"   # store directory, see rag_store.py
+HISTORY_DB = "app_history.sqlite3"   # questions and flags, see history_store.py
+TRACE_IDS = True           # store each request's trace id with its history row
+SERVING_WORKERS = 0        # retrieval worker processes sharing the mmapped store (0 = all in the UI process)
+STORE_RELOAD_SEC = 10      # poll for a rebuilt store and swap it in without a restart (None = off)
 
 #embedder = SentenceTransformer("all-MiniLM-L6-v2")
-embedder = SentenceTransformer("sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+# Models load on first use or in the background warmup, never at import
+embedder = Lazy("embedder", lambda: load_embedder(EMBED_MODEL, EMBED_BACKEND, EMBED_THREADS))
 
+def count_tokens(texts):
+    return tokenizer_counter(embedder.get().tokenizer)(texts)
+
+# Chunks are sized in the embedder's own tokens (minus [CLS]/[SEP]) so none get truncated when embedded
+chunker = Lazy("chunker", lambda: SentenceChunker(count_tokens, CHUNK_TOKENS or embedder.get().max_seq_length - 2,
+                                                  CHUNK_OVERLAP_TOKENS))
+
+def load_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL)
+
+reranker = None
+if RERANK_MODEL:
+    cross_encoder = Lazy("cross-encoder", load_cross_encoder)
+    reranker = Reranker(lambda pairs: cross_encoder.get().predict(pairs, batch_size=len(pairs), convert_to_numpy=True),
+                        RERANK_CANDIDATES, RERANK_BUDGET_MS, QUERY_CACHE_SIZE, QUERY_CACHE_TTL)
+
+# Serving workers (rag_serving.py) import this module too; only the main process serves the
+# UI, owns the worker pool and writes history
+MAIN_PROCESS = multiprocessing.parent_process() is None
 faiss_store = None
-counter_lock = threading.Lock()
+bm25_index = None
+store_generation = 0  # bumped on every reload; part of the retrieval and rerank cache keys
+store_lock = threading.Lock()  # faiss_store, bm25_index and store_generation are swapped together on reload
+# BM25 runs here while the calling thread waits on the dense search batcher
+retrieval_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="bm25")
+query_cache = QueryCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, ANSWER_CACHE_THRESHOLD)
+# Concurrent requests share one encoder pass and one FAISS search per author
+embed_batcher = MicroBatcher(
+    lambda questions: embedder.get().encode(questions),
+    QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, name="embed-batcher")
+ollama_client = ollama.AsyncClient()
+generation_gate = GenerationGate(MAX_CONCURRENT_GENERATIONS, MAX_QUEUED_GENERATIONS)
+
+def search_batch(requests):
+    """search_many per index: (index, q_emb, author_filter, k) requests queued across a reload
+    still search the store they started on."""
+    groups = {}
+    for pos, (index, *request) in enumerate(requests):
+        groups.setdefault(id(index), (index, []))[1].append((pos, tuple(request)))
+    results = [None] * len(requests)
+    for index, items in groups.values():
+        found = search_many(index, [request for _, request in items], nprobe=NPROBE, ef_search=EF_SEARCH)
+        for (pos, _), result in zip(items, found):
+            results[pos] = result
+    return results
+
+search_batcher = MicroBatcher(search_batch, QUERY_BATCH_SIZE, QUERY_BATCH_WAIT_MS, name="search-batcher")
+history = HistoryStore(HISTORY_DB) if MAIN_PROCESS else None
+
+# Background warmup: load and exercise the models while the store loads and the UI starts
+warmup = Warmup()
+serving_pool = None  # WorkerPool, created at startup when SERVING_WORKERS is set
+worker_cache_stats = {}  # serving worker pid -> its latest cache counters, summed into /metrics
+if SERVING_WORKERS:
+    # the workers load the models (init_serving_worker); this process only streams answers
+    warmup.add("serving workers", lambda: serving_pool.start())
+else:
+    warmup.add("embedder", lambda: embedder.get().encode(["warmup"]))
+    if reranker is not None:
+        warmup.add("cross-encoder", lambda: cross_encoder.get().predict([("warmup", "warmup")]))
+# loads the LLM into Ollama's memory; questions still work (slower first answer) if this fails
+warmup.add("ollama model", lambda: ollama.Client().generate(model=MODEL_NAME, prompt="", keep_alive=OLLAMA_KEEP_ALIVE),
+           required=False)
+# ---------------- PROMPT ----------------
+# Fixed instructions are sent as the system message, unchanged between requests, so Ollama
+# reuses their KV cache and only prefills the context and question
+SYSTEM_PROMPT = """
+You are a wise and compassionate spiritual guide.
+Your role is to answer the user’s question based on the provided context from sacred or philosophical texts.
+
+Instructions for your response:
+1. Ground your answer in the given context, integrating its wisdom naturally.
+2. Provide a complete, well-rounded explanation.
+3. If the context is about compassion, respond warmly and empathetically.
+   If the context is about knowledge, respond with clarity and depth.
+4. Always inspire the reader — leave them with hope, strength, or a deeper perspective.
+5. Use simple, graceful language that is easy to follow.
+6. Do not merely summarize the context; weave it into a meaningful, life-affirming answer.
+7. Try to keep the answer short unless asked for detailed answer.
+8. Answer in language of Question
+9. In case question is not clear or not related to context , dont answer and apologise humbly
+"""
 # ---------------- Logging ----------------
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
 # ---------------- Document Loading ----------------
-# ---------------- HELPERS ----------------
-def extract_text(file_path):
-    """Extract text from PDF or TXT, robustly."""
-    if file_path.endswith(".txt"):
-        try:
-            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
-                return f.read()
-        except Exception as e:
-            print(f"⚠️ Skipping TXT {file_path}: {e}")
-            return ""
-    elif file_path.endswith(".pdf"):
-        try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                t = page.extract_text()
-                if t:
-                    text += t
-            return text
-        except Exception as e:
-            print(f"⚠️ Skipping PDF {file_path}: {e}")
-            return ""
-    return ""
+# extract_text lives in rag_build so the ingestion process pool can import it cheaply
 
 # ---------------- BUILD FAISS ----------------
+def chunk_text(file_path, text):
+    """Split one extracted source file into chunks plus their metadata."""
+    if not text.strip():
+        return [], []  # skip empty or failed files
+
+    # Infer author/book from folder structure: /Author/Book/file
+    parts = Path(file_path).parts
+    author = parts[-2] if len(parts) >= 3 else "Unknown"
+    book = parts[-1] if len(parts) >= 2 else "Unknown"
+    logging.info(f"Loading Author {author} Book {book}  ")
+    chunks = chunker.get()(text)
+    return chunks, [{"author": author, "book": book, "file": os.path.basename(file_path)}] * len(chunks)
+
+def embed_documents(documents):
+    return embedder.get().encode(documents)
+
 def build_faiss_index(folder_path, output_file=INDEX_FILE):
-    t0 = time.time()
-    documents = []
-    metadata_list = []
-
-    for root, _, files in os.walk(folder_path):
-        for file in files:
-            if file.endswith(".txt") or file.endswith(".pdf"):
-                file_path = os.path.join(root, file)
-                text = extract_text(file_path)
-                if not text.strip():
-                    continue  # skip empty or failed files
-
-                # Infer author/book from folder structure: /Author/Book/file
-                parts = Path(file_path).parts
-                author = parts[-2] if len(parts) >= 3 else "Unknown"
-                book = parts[-1] if len(parts) >= 2 else "Unknown"
-                logging.info(f"Loading Author {author} Book {book}  ")
-                chunks = [text[i:i+CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
-                documents.extend(chunks)
-                metadata_list.extend([{"author": author, "book": book, "file": file}] * len(chunks))
-
-    logging.info(f"Document loading took {time.time() - t0:.2f} sec")
-    if not documents:
-        raise ValueError("No valid .txt or .pdf documents found in the folder.")
-
-    t1 = time.time()
-    embeddings = embedder.encode(documents, convert_to_numpy=True).astype(np.float32)
-    logging.info(f"Embedding took {time.time() - t1:.2f} sec")
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
-    logging.info(f"Indexing took {time.time() - t1:.2f} sec (including embedding)")
-
-    with open(output_file, "wb") as f:
-        pickle.dump((index, documents, metadata_list), f)
-
-    logging.info(f"Total build_faiss_index time: {time.time() - t0:.2f} sec")
+    update_store(folder_path, output_file, chunk_text, embed_documents, INDEX_TYPE, rebuild=True,
+                 workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE, chunker_key=chunker.get().key,
+                 embedding_cache=EmbeddingCache(EMBED_CACHE_DIR, cache_name(EMBED_MODEL, EMBED_BACKEND), EMBED_CACHE_MAX_ENTRIES),
+                 metric=INDEX_METRIC, codec=INDEX_CODEC, text_codec=TEXT_CODEC)
     print(f"✅ FAISS index built and saved to {output_file}")
-    return index, documents, metadata_list
+    return load_store(output_file)
+
+def update_faiss_index(folder_path, output_file=INDEX_FILE):
+    """Embed only new or changed books, drop deleted ones, then swap the store in place."""
+    if update_store(folder_path, output_file, chunk_text, embed_documents, INDEX_TYPE,
+                    workers=INGEST_WORKERS, batch_size=EMBED_BATCH_SIZE, chunker_key=chunker.get().key,
+                    embedding_cache=EmbeddingCache(EMBED_CACHE_DIR, cache_name(EMBED_MODEL, EMBED_BACKEND), EMBED_CACHE_MAX_ENTRIES),
+                    metric=INDEX_METRIC, codec=INDEX_CODEC, text_codec=TEXT_CODEC):
+        print(f"✅ FAISS index updated in {output_file}")
 
 def load_faiss_index(file=INDEX_FILE):
     if not os.path.exists(file):
         raise FileNotFoundError("FAISS index not found. Build it first.")
-    with open(file, "rb") as f:
-        index, docs, metadata = pickle.load(f)
-    return index, docs, metadata
+    return load_store(file)
 
 def get_authors(metadata):
-    return sorted(list(set(m["author"] for m in metadata)))
+    return list(metadata.authors)
 
-def get_last_counter():
-    try:
-        with open(history_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
-        for line in reversed(lines):
-            match = re.match(r"Q(\d+):", line)
-            if match:
-                return int(match.group(1))
-    except FileNotFoundError:
-        pass
-    return 0
-
-question_counter = get_last_counter()
-
-def log_history(question, answer):
-    global question_counter
-
-    with counter_lock:
-        question_counter += 1
-        with open(history_file, "a", encoding="utf-8") as f:
-            f.write(f"Q{question_counter}: {question}\nA{question_counter}: {answer} Date of Question {datetime.now()}\n---\n")
+def log_history(question, answer, author=None, trace=None):
+    """Question id of the logged pair; the row is written in the background."""
+    return history.log(question, answer, author, trace.trace_id if trace is not None and TRACE_IDS else None)
 
 # ---------------- QUERY ----------------
-def query_rag_stream(question, author):
-    global faiss_store, question_counter
-    index, docs, metadata = faiss_store
+def current_store():
+    """(store, bm25 index, store generation) as one consistent snapshot across reloads."""
+    with store_lock:
+        return faiss_store, bm25_index, store_generation
+
+def open_store(path=INDEX_FILE):
+    """Map the store at path and switch new requests over to it."""
+    global faiss_store, bm25_index, store_generation
+    store = load_faiss_index(path)
+    bm25 = load_bm25(path, store[1].chunk_ids)
+    with store_lock:
+        faiss_store, bm25_index = store, bm25
+        store_generation += 1
+    # cached retrievals and answers were built from the old chunks. A full rebuild numbers chunks
+    # from 0 again, so chunk ids are also cached under their store generation: a request still
+    # running on the old store can't put ids the new store would read
+    query_cache.clear()
+    if reranker is not None:
+        reranker.scores.clear()
+    return store
+
+def reload_store():
+    """Hot reload after a rebuild swapped a new store into place (see rag_serving.StoreWatcher)."""
+    store = open_store()
+    if serving_pool is not None:
+        serving_pool.reload()
+    logging.info(f"✅ Reloaded {INDEX_FILE}, {store[0].ntotal} vectors.")
+
+def embed_question(question):
+    # Embed query (cached per normalized question)
+    return query_cache.embed(question, lambda q: embed_batcher(q)[None, :])
+
+def retrieve_context(question, q_emb, author, author_filter, store, bm25, store_gen, trace):
+    """Search, rerank and pack the hits into the prompt context; None when nothing was found."""
+    index, docs, metadata, _ = store
+
+    def dense_search(k):
+        t_dense = time.perf_counter()
+        if author_filter is None or AUTHOR_PREFILTER:
+            # Single exact top-K pass, restricted to the author's chunks when one is selected
+            D, I = search_batcher((index, q_emb, author_filter, k))
+            ids = [int(i) for i in I if i >= 0]
+        else:
+            # Search only top N candidates for speed, then keep the author's hits
+            N_CANDIDATES = min(max(100, k), len(docs))
+            D, I = search_batcher((index, q_emb, None, N_CANDIDATES))
+            ids = [int(i) for i in I if i >= 0 and i in author_filter.id_set][:k]
+        trace.record("search_dense", time.perf_counter() - t_dense)
+        return ids
+
+    def bm25_search(k):
+        with trace.span("search_bm25"):
+            _, ids = bm25.search(question, k, author_filter)
+        return ids.tolist()
+
+    # With a reranker, retrieval returns a wider candidate list for it to narrow down to TOP_K
+    n_results = RERANK_CANDIDATES if reranker is not None else TOP_K
+
+    def search():
+        if not HYBRID_SEARCH or bm25 is None:
+            return dense_search(n_results)
+        lexical = retrieval_pool.submit(bm25_search, max(HYBRID_CANDIDATES, n_results))
+        dense = dense_search(max(HYBRID_CANDIDATES, n_results))
+        return reciprocal_rank_fusion([dense, lexical.result()], [DENSE_WEIGHT, BM25_WEIGHT], RRF_K, n_results)
+
+    with trace.span("search"):
+        I_filtered = query_cache.retrieve(q_emb, author, search, store_gen)
+    if reranker is not None:
+        with trace.span("rerank"):
+            I_filtered = reranker.rerank(question, I_filtered, docs.__getitem__, TOP_K, store_gen)
+    retrieved = [(docs[i], metadata[i]) for i in I_filtered]
+    if not retrieved:
+        return None
+
+    # Build context within the token budget
+    with trace.span("context"):
+        context, _, _ = pack_context(retrieved, count_tokens, CONTEXT_TOKENS)
+    return context
+
+# ---------------- SERVING WORKERS ----------------
+worker_store_version = 0
+
+def init_serving_worker(workers):
+    """Serving worker process setup: split the CPUs between workers, load the models, map the store."""
+    global EMBED_THREADS
+    import faiss
+
+    EMBED_THREADS = EMBED_THREADS or max(1, (os.cpu_count() or 1) // workers)
+    faiss.omp_set_num_threads(EMBED_THREADS)
+    embedder.get().encode(["warmup"])
+    if reranker is not None:
+        cross_encoder.get().predict([("warmup", "warmup")])
+    open_store()
+
+def worker_retrieve(question, author, store_version):
+    """query_rag_stream's retrieval in a serving worker: (q_emb, context, stage seconds, (pid, cache stats)).
+
+    q_emb is None for an unknown author and context None when nothing was found. The embedding,
+    retrieval and rerank caches live in the workers, so their counters travel back for /metrics.
+    """
+    global worker_store_version
+    if store_version != worker_store_version:
+        open_store()
+        worker_store_version = store_version
+    trace = RequestTrace()
+    store, bm25, store_gen = current_store()
+    with trace.span("filter"):
+        author_filter = store[3].get(author.lower()) if author != "All" else None
+    if author != "All" and author_filter is None:
+        return None, None, trace.stages, (os.getpid(), cache_stats(query_cache, reranker))
+    with trace.span("embed"):
+        q_emb = embed_question(question)
+    context = retrieve_context(question, q_emb, author, author_filter, store, bm25, store_gen, trace)
+    return q_emb, context, trace.stages, (os.getpid(), cache_stats(query_cache, reranker))
+
+async def query_rag_stream(question, author):
     chat_pairs = []
 
-    logging.info(f"Question {question} Received for Author {author}")
+    trace = RequestTrace()
+    logging.info(f"[trace {trace.trace_id}] Question {question} Received for Author {author}")
 
-    start_time = time.time()
-    # Filter by author
-    if author != "All":
-        filtered_indices = [i for i, m in enumerate(metadata) if m["author"].lower() == author.lower()]
-        if not filtered_indices:
-            answer = f"No documents found for author '{author}'."
+    if not warmup.ready:
+        # The UI comes up before the models: hold the question until they are loaded
+        chat_pairs.append((question, warmup.status()))
+        yield chat_pairs
+        with trace.span("warmup_wait"):
+            await asyncio.to_thread(warmup.wait)
+        chat_pairs.pop()
+        if not warmup.ready:
+            # a failed required step (models, serving workers) never recovers without a restart
+            answer = warmup.status()
+            logging.error(f"[trace {trace.trace_id}] Not answering: {answer}")
             chat_pairs.append((question, answer))
-            log_history(question, answer)
+            trace.finish("startup_failed")
             yield chat_pairs
             return
-    else:
-        filtered_indices = list(range(len(docs)))
-
-    logging.info(f"Author filtering took {time.time() - start_time:.2f} sec")
-
-    # Embed query
-    t_embed = time.time()
-    q_emb = embedder.encode([question], convert_to_numpy=True).astype(np.float32)
-    logging.info(f"Query embedding took {time.time() - t_embed:.2f} sec")
 
-    # Search only top N candidates for speed
-    N_CANDIDATES = min(100, len(docs))
-    t_search = time.time()
-    D, I = index.search(q_emb, N_CANDIDATES)
-    logging.info(f"FAISS search (top {N_CANDIDATES}) took {time.time() - t_search:.2f} sec")
+    context = None
+    if serving_pool is not None:
+        # Embedding, search, rerank and context packing run in a worker process, outside our GIL
+        with trace.span("worker"):
+            q_emb, context, stages, (pid, stats) = await serving_pool.run(worker_retrieve, question, author)
+        worker_cache_stats[pid] = stats
+        for stage, seconds in stages.items():
+            trace.record(stage, seconds)
+    else:
+        store, bm25, store_gen = current_store()
+        # Filter by author
+        with trace.span("filter"):
+            author_filter = store[3].get(author.lower()) if author != "All" else None
+        q_emb = None
+        if author == "All" or author_filter is not None:
+            # Blocking cache/batcher calls run on worker threads so the event loop keeps streaming
+            with trace.span("embed"):
+                q_emb = await asyncio.to_thread(embed_question, question)
+    if q_emb is None:
+        answer = f"No documents found for author '{author}'."
+        chat_pairs.append((question, answer))
+        log_history(question, answer, author, trace)
+        trace.finish("unknown_author")
+        yield chat_pairs
+        return
 
-    # Keep only filtered results
-    I_filtered = [i for i in I[0] if i in filtered_indices][:TOP_K]
-    retrieved = [(docs[i], metadata[i]) for i in I_filtered]
+    # Near-identical question already answered for this author and model: replay it
+    cached_answer = query_cache.answer(q_emb, author, MODEL_NAME)
+    if cached_answer is not None:
+        answer = cached_answer + "\n\n⏱️ Time taken:  0.00 sec (cached answer) \n"
+        chat_pairs.append((question, answer))
+        log_history(question, answer, author, trace)
+        trace.finish("cached_answer")
+        yield chat_pairs
+        return
 
-    if not retrieved:
+    if serving_pool is None:
+        context = await asyncio.to_thread(retrieve_context, question, q_emb, author, author_filter, store, bm25,
+                                          store_gen, trace)
+    if context is None:
         answer = f"No relevant documents found for author '{author}'."
         chat_pairs.append((question, answer))
-        log_history(question, answer)
+        log_history(question, answer, author, trace)
+        trace.finish("empty_retrieval")
         yield chat_pairs
         return
 
-    # Build context
-    t_context = time.time()
-    context = "\n\n---\n\n".join(
-        f"[{m['author']} - {m['book']}]: {d[:CHUNK_SIZE]}" for d, m in retrieved
-    )
-    logging.info(f"Context building took {time.time() - t_context:.2f} sec")
-    user_prompt = f"""
-You are a wise and compassionate spiritual guide.
-Your role is to answer the user’s question based on the provided context from sacred or philosophical texts.
-
-Instructions for your response:
-1. Ground your answer in the given context, integrating its wisdom naturally.
-2. Provide a complete, well-rounded explanation.
-3. If the context is about compassion, respond warmly and empathetically.
-   If the context is about knowledge, respond with clarity and depth.
-4. Always inspire the reader — leave them with hope, strength, or a deeper perspective.
-5. Use simple, graceful language that is easy to follow.
-6. Do not merely summarize the context; weave it into a meaningful, life-affirming answer.
-7. Try to keep the answer short unless asked for detailed answer.
-8. Answer in language of Question
-9. In case question is not clear or not related to context , dont answer and apologise humbly
-
-
-Context: {context}
-
-Question: {question}
-"""
+    messages = chat_messages(SYSTEM_PROMPT, context, question)
     # Append assistant message placeholder
     chat_pairs.append((question, ""))
 
-    elapsed = time.time() - start_time
-    logging.info(f"Total retrieval (pre-LLM) took {elapsed:.2f} sec")
+    # Wait for a free generation slot, showing the user their place in the queue
+    try:
+        with trace.span("queue"):
+            async for position in generation_gate.admit():
+                chat_pairs[-1] = (question, f"⏳ Many seekers are asking right now, you are number {position} in the queue...")
+                yield chat_pairs
+    except QueueFull:
+        answer = "🙏 Too many questions are being answered right now. Please ask again in a minute."
+        chat_pairs[-1] = (question, answer)
+        log_history(question, answer, author, trace)
+        trace.finish("queue_full")
+        yield chat_pairs
+        return
 
     # Stream response from Ollama
     try:
-        t_llm = time.time()
-        for chunk in ollama.chat(model=MODEL_NAME, messages=[{"role": "user", "content": user_prompt}], stream=True):
-            text_piece = chunk["message"].get("content", "")
-            if text_piece:
-                chat_pairs[-1] = (question, chat_pairs[-1][1] + text_piece)
+        chat_pairs[-1] = (question, "")
+        t_llm = time.perf_counter()
+        ttft = None
+        answer = ""
+        stream = await ollama_client.chat(model=MODEL_NAME, messages=messages, stream=True,
+                                          options={"num_ctx": NUM_CTX, "num_predict": NUM_PREDICT},
+                                          keep_alive=OLLAMA_KEEP_ALIVE)
+        # One UI update per batch of tokens; Gradio 4 then sends the client only the appended text
+        async for chunks in coalesce(stream, STREAM_FLUSH_MS / 1000, STREAM_FLUSH_TOKENS):
+            chunk = chunks[-1]
+            delta = "".join(c["message"].get("content", "") for c in chunks)
+            if delta:
+                if ttft is None:
+                    ttft = time.perf_counter() - t_llm
+                    trace.record("ttft", ttft)
+                answer += delta
+                chat_pairs[-1] = (question, answer)
                 yield chat_pairs
-        llm_time = time.time() - t_llm
-        logging.info(f"LLM streaming took {llm_time:.2f} sec")
-        answer = chat_pairs[-1][1]
+        llm_time = time.perf_counter() - t_llm
+        trace.record("generation", llm_time)
+        log_generation_stats(chunk, ttft or llm_time)
+        query_cache.store_answer(q_emb, author, MODEL_NAME, answer)
         answer += f"\n\n⏱️ Time taken:  {llm_time:.2f} sec \n"
         chat_pairs[-1] = (question, answer)
-        log_history(question, answer)
+        log_history(question, answer, author, trace)
+        trace.finish("answered")
         yield chat_pairs
     except Exception as e:
         error_msg = f"❌ Streaming error: {e}"
         chat_pairs[-1] = (question, error_msg)
-        log_history(question, error_msg)
+        log_history(question, error_msg, author, trace)
+        trace.finish("stream_error")
         yield chat_pairs
+    finally:
+        generation_gate.release()
 
 # ---------------- GRADIO UI ----------------
 def launch_ui():
+    import gradio as gr
+
     global faiss_store
-    index, docs, metadata = faiss_store
+    index, docs, metadata, author_filters = faiss_store
     authors = ["All"] + get_authors(metadata)
 
     with gr.Blocks() as demo:
         gr.Markdown("# 📚 RAG Chatbot with Author Filter")
+        status = gr.Markdown(warmup.status())
 
         with gr.Row():
             q_input = gr.Textbox(label="Your Question", lines=2)
@@ -244,21 +474,42 @@ def launch_ui():
         ask_btn.click(
             fn=query_rag_stream,
             inputs=[q_input, author_dropdown],
-            outputs=[chatbot]
+            outputs=[chatbot],
+            concurrency_limit=UI_CONCURRENCY
         )
 
-    demo.launch(server_name="0.0.0.0", server_port=7860)
+        # readiness banner, polled until warmup finishes
+        demo.load(warmup.status, None, status, every=2)
+        # new visitors also see authors added by a hot reload
+        demo.load(lambda: gr.update(choices=["All"] + get_authors(current_store()[0][2])), None, author_dropdown)
+
+    REGISTRY.collectors.append(cache_collector(query_cache, reranker, worker_cache_stats))
+    # Gradio UI at /, Prometheus metrics at /metrics, readiness probe at /ready
+    serve(demo, "0.0.0.0", 7860, ready=lambda: warmup.ready,
+          on_startup=lambda: (STARTUP.mark("ui listening"), STARTUP.report()))
 
 if __name__ == "__main__":
     folder = "/Users/antarikshbhardwaj/Documents/RAG/App Books/"
+    recover_store(INDEX_FILE)  # a crash mid-swap must not cost a full re-embed
+    # a build loads only the embedder (on first use); workers and the LLM wait until there is a store
     if not os.path.exists(INDEX_FILE):
         build_faiss_index(folder)
-
-    # Load FAISS index once at startup
-    start_time = time.time()
-    faiss_store = load_faiss_index()
-    elapsed = time.time() - start_time
-    logging.info(f"✅ FAISS index loaded in {elapsed:.2f} seconds.")
+    elif "--update" in sys.argv:
+        update_faiss_index(folder)
+    if "--no-serve" in sys.argv:
+        # e.g. --update --no-serve next to a running server, which then hot reloads the new store
+        sys.exit(0)
+    if SERVING_WORKERS:
+        serving_pool = WorkerPool(SERVING_WORKERS, init_serving_worker, (SERVING_WORKERS,))
+    warmup.start()
+
+    # Load FAISS index once at startup (memory-mapped, so this doesn't read the vectors)
+    with STARTUP.phase("load store"):
+        open_store()
+    logging.info(f"✅ FAISS index loaded, {faiss_store[0].ntotal} vectors.")
+    if STORE_RELOAD_SEC:
+        StoreWatcher(INDEX_FILE, reload_store, STORE_RELOAD_SEC).start()
 
     # Pass the loaded index to the UI
     launch_ui()
+    history.flush()
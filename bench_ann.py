@@ -0,0 +1,154 @@
+"""Recall@K, latency and memory of the ANN index options against the exact flat baseline.
+
+The baseline is the original layout: flat, L2, float32. Cosine and fp16/int8 layouts are
+measured against it too ("recall") and against exact search with their own metric ("same",
+the loss from compression alone). --text adds the chunk text footprint raw vs zstd blocks.
+
+Usage: python bench_ann.py [--store faiss_store_author] [--k 3] [--queries 200] [--text]
+"""
+import argparse
+import json
+import os
+import time
+
+import faiss
+import numpy as np
+
+from rag_index import INDEX_TYPES, base_index, create_index, search_index
+from rag_store import BLOCK_CHUNKS, load_store, read_manifest
+
+COSINE = {"metric": "cosine"}
+# (index_type, layout, query-time knobs) combinations to compare; the first is the baseline
+CONFIGS = [
+    ("flat", {}, {}),
+    ("flat", COSINE, {}),
+    ("flat", {"codec": "fp16"}, {}),
+    ("flat", {"codec": "int8"}, {}),
+    ("flat", {**COSINE, "codec": "fp16"}, {}),
+    ("flat", {**COSINE, "codec": "int8"}, {}),
+    ("ivf_flat", {}, {"nprobe": 4}),
+    ("ivf_flat", {}, {"nprobe": 16}),
+    ("ivf_flat", {}, {"nprobe": 64}),
+    ("ivf_flat", {**COSINE, "codec": "int8"}, {"nprobe": 16}),
+    ("ivf_pq", {}, {"nprobe": 16}),
+    ("ivf_pq", {}, {"nprobe": 64}),
+    ("hnsw", {}, {"ef_search": 32}),
+    ("hnsw", {}, {"ef_search": 64}),
+    ("hnsw", {}, {"ef_search": 128}),
+    ("hnsw", {**COSINE, "codec": "int8"}, {"ef_search": 64}),
+]
+
+def load_embeddings(store_file):
+    """Recover the stored vectors from the flat index of a store directory."""
+    manifest = read_manifest(store_file)
+    layout = (manifest.get("metric", "l2"), manifest.get("codec", "float32"))
+    if layout != ("l2", "float32"):
+        # normalized or quantized vectors would make a lossy baseline and flatter every recall
+        raise SystemExit(f"{store_file} stores {layout[0]}/{layout[1]} vectors; the baseline needs an "
+                         f"l2/float32 store (rebuild a copy with INDEX_METRIC='l2', INDEX_CODEC='float32')")
+    index = faiss.read_index(os.path.join(store_file, "index.faiss"))
+    # keep the IDMap wrapper alive: it owns the index underneath
+    return base_index(index).reconstruct_n(0, index.ntotal)
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def run(embeddings, k, n_queries, seed=0):
+    rng = np.random.default_rng(seed)
+    query_rows = rng.choice(len(embeddings), min(n_queries, len(embeddings) // 10), replace=False)
+    mask = np.ones(len(embeddings), dtype=bool)
+    mask[query_rows] = False
+    base, queries = embeddings[mask], embeddings[query_rows]
+
+    results = []
+    built = {}
+    truth = None
+    exact = {}  # metric -> flat float32 results, to separate quantization loss from the metric change
+    for index_type, layout, knobs in CONFIGS:
+        key = (index_type, tuple(sorted(layout.items())))
+        if key not in built:
+            t0 = time.perf_counter()
+            built[key] = (create_index(base, index_type, **layout), time.perf_counter() - t0)
+        index, build_sec = built[key]
+
+        # One query at a time, like query_rag_stream does
+        latencies = []
+        found = np.empty((len(queries), k), dtype=np.int64)
+        for i, q in enumerate(queries):
+            t0 = time.perf_counter()
+            _, I = search_index(index, q[None, :], k, **knobs)
+            latencies.append(time.perf_counter() - t0)
+            found[i] = I[0]
+        if truth is None:
+            truth = found
+        metric = layout.get("metric", "l2")
+        if index_type == "flat" and layout.get("codec", "float32") == "float32":
+            exact[metric] = found
+
+        results.append({
+            "index_type": index_type,
+            "metric": metric,
+            "codec": layout.get("codec", "float32"),
+            **knobs,
+            "build_sec": round(build_sec, 3),
+            "index_mb": round(faiss.serialize_index(index).nbytes / 2**20, 2),
+            "recall_at_k": round(recall_at_k(found, truth), 4),
+            "recall_same_metric": round(recall_at_k(found, exact[metric]), 4),
+            "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 3),
+        })
+    return results
+
+def text_footprint(store_dir, k, n_queries, block_chunks=BLOCK_CHUNKS, level=9, seed=0):
+    """Chunk text size raw vs zstd blocks, and the cost of decompressing the k hits of a query."""
+    import zstandard
+
+    _, docs, _, _ = load_store(store_dir)
+    texts = [docs.at(row).encode("utf-8") for row in range(len(docs))]
+    compressor = zstandard.ZstdCompressor(level=level)
+    blocks = [compressor.compress(b"".join(texts[i:i + block_chunks])) for i in range(0, len(texts), block_chunks)]
+
+    decompressor = zstandard.ZstdDecompressor()
+    rng = np.random.default_rng(seed)
+    t0 = time.perf_counter()
+    for _ in range(n_queries):
+        for row in rng.choice(len(texts), k):
+            decompressor.decompress(blocks[row // block_chunks])  # worst case: no block cache hit
+    raw, packed = sum(map(len, texts)), sum(map(len, blocks))
+    return {"chunks": len(texts), "raw_mb": round(raw / 2**20, 2), "zstd_mb": round(packed / 2**20, 2),
+            "ratio": round(raw / max(packed, 1), 2),
+            "decompress_ms_per_query": round((time.perf_counter() - t0) / n_queries * 1000, 3)}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", default="faiss_store_author")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--text", action="store_true", help="also report chunk text size raw vs zstd")
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+
+    CONFIGS[:] = [c for c in CONFIGS if c[0] == "flat" or c[0] in args.types]
+    embeddings = load_embeddings(args.store)
+    print(f"{len(embeddings)} vectors, dim {embeddings.shape[1]}, recall@{args.k} vs flat/l2/float32")
+    results = run(embeddings, args.k, args.queries)
+
+    print(f"{'index':<10} {'metric':<7} {'codec':<8} {'knobs':<16} {'build s':>8} {'MB':>8} {'recall':>7} "
+          f"{'same':>7} {'p50 ms':>8} {'p95 ms':>8}")
+    for r in results:
+        knobs = ", ".join(f"{key}={r[key]}" for key in ("nprobe", "ef_search") if key in r)
+        print(f"{r['index_type']:<10} {r['metric']:<7} {r['codec']:<8} {knobs:<16} {r['build_sec']:>8} "
+              f"{r['index_mb']:>8} {r['recall_at_k']:>7} {r['recall_same_metric']:>7} {r['p50_ms']:>8} {r['p95_ms']:>8}")
+    if args.text:
+        text = text_footprint(args.store, args.k, args.queries)
+        print(f"chunk text: {text['chunks']} chunks, {text['raw_mb']} MB raw, {text['zstd_mb']} MB zstd "
+              f"({text['ratio']}x), {text['decompress_ms_per_query']} ms to decompress {args.k} hits")
+        results = {"index": results, "text": text}
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""Reproducible ingestion, retrieval-stage and concurrent end-to-end benchmarks for the RAG app.
+
+Generates a synthetic corpus, builds a store from it with the app's own chunker and embedder,
+times every query stage separately, then drives the app's streaming query_rag_stream with
+concurrent clients against a local fake Ollama server that streams tokens at a fixed rate.
+Results go to JSON; --baseline compares against an earlier run and exits 1 on regressions.
+
+Usage: python bench_rag.py [--app app_rag] [--json results.json] [--baseline old.json]
+       python bench_rag.py --serve-ollama 11435     (just the fake Ollama server)
+"""
+import argparse
+import asyncio
+import importlib
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+WORDS = ("the self is not the body mind peace devotion love truth grace surrender silence breath "
+         "meditation service knowledge action duty compassion joy sorrow desire freedom light "
+         "heart teacher disciple path river mountain prayer faith world witness awareness").split()
+TERMS = ("atman brahman dharma karma moksha samadhi bhakti jnana maya prana ahimsa satsang "
+         "kundalini nirvana sangha vairagya tapas seva guru mantra").split()
+
+# ---------------- SYNTHETIC CORPUS ----------------
+def generate_corpus(root, n_authors=4, books_per_author=5, paragraphs_per_book=200, seed=0):
+    """Write <root>/<Author>/<Book>.txt files and return [(sentence, relative path)] to query with.
+
+    chunk_text takes the author from the parent folder, so each book is one file in its author's folder.
+    """
+    rng = random.Random(seed)
+    if os.path.exists(root):
+        shutil.rmtree(root)
+    probes = []
+    for a in range(n_authors):
+        author_dir = os.path.join(root, f"Author {a:02d}")
+        os.makedirs(author_dir)
+        for b in range(books_per_author):
+            rel = os.path.join(f"Author {a:02d}", f"Book {b:02d}.txt")
+            paragraphs = []
+            for p in range(paragraphs_per_book):
+                sentences = []
+                for _ in range(rng.randint(3, 6)):
+                    words = rng.choices(WORDS, k=rng.randint(8, 20)) + [rng.choice(TERMS)]
+                    # a reference unique to this paragraph, like a verse number
+                    words.append(f"{a}.{b}.{p}")
+                    rng.shuffle(words)
+                    sentences.append(" ".join(words).capitalize() + ".")
+                paragraphs.append(" ".join(sentences))
+                if rng.random() < 0.02:
+                    probes.append((sentences[0], rel))
+            with open(os.path.join(root, rel), "w", encoding="utf-8") as f:
+                f.write("\n\n".join(paragraphs))
+    return probes
+
+# ---------------- FAKE OLLAMA ----------------
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    tokens_per_sec = 50.0
+    answer_tokens = 100
+    prefill_sec = 0.05
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"Ollama is running")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.path == "/api/generate":
+            # the app's warmup preloads the model with an empty, non-streaming generate
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(json.dumps({"model": body.get("model", "fake"), "created_at": "1970-01-01T00:00:00Z",
+                                         "response": "", "done": True}).encode("utf-8"))
+            return
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages", []))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+
+        def send(obj):
+            self.wfile.write(json.dumps(obj).encode("utf-8") + b"\n")
+            self.wfile.flush()
+
+        time.sleep(self.prefill_sec)
+        model = body.get("model", "fake")
+        for i in range(self.answer_tokens):
+            time.sleep(1.0 / self.tokens_per_sec)
+            send({"model": model, "created_at": "1970-01-01T00:00:00Z",
+                  "message": {"role": "assistant", "content": f"tok{i} "}, "done": False})
+        send({"model": model, "created_at": "1970-01-01T00:00:00Z", "message": {"role": "assistant", "content": ""},
+              "done": True, "done_reason": "stop", "prompt_eval_count": prompt_chars // 4,
+              "prompt_eval_duration": int(self.prefill_sec * 1e9), "eval_count": self.answer_tokens,
+              "eval_duration": int(self.answer_tokens / self.tokens_per_sec * 1e9)})
+
+def start_fake_ollama(port=0, tokens_per_sec=50.0, answer_tokens=100):
+    FakeOllamaHandler.tokens_per_sec = tokens_per_sec
+    FakeOllamaHandler.answer_tokens = answer_tokens
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeOllamaHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-ollama", daemon=True).start()
+    return server
+
+# ---------------- MEASUREMENT ----------------
+def latency_summary(seconds):
+    ms = np.asarray(seconds, dtype=np.float64) * 1000
+    if not len(ms):
+        return {"n": 0}
+    return {"n": len(ms), "mean_ms": round(float(ms.mean()), 3),
+            **{f"p{p}_ms": round(float(np.percentile(ms, p)), 3) for p in (50, 95, 99)}}
+
+def bench_ingestion(app, corpus_dir, store_dir):
+    from rag_build import scan_sources, update_store
+    from rag_store import read_manifest
+
+    embed_seconds = [0.0]
+
+    def timed_embed(chunks):
+        t0 = time.perf_counter()
+        vectors = app.embed_documents(chunks)
+        embed_seconds[0] += time.perf_counter() - t0
+        return vectors
+
+    # no embedding cache: this measures the real encoder throughput
+    t0 = time.perf_counter()
+    update_store(corpus_dir, store_dir, app.chunk_text, timed_embed, app.INDEX_TYPE, rebuild=True,
+                 workers=app.INGEST_WORKERS, batch_size=app.EMBED_BATCH_SIZE, chunker_key=app.chunker.get().key,
+                 metric=app.INDEX_METRIC, codec=app.INDEX_CODEC, text_codec=app.TEXT_CODEC)
+    total = time.perf_counter() - t0
+    files = len(scan_sources(corpus_dir))
+    chunks = read_manifest(store_dir)["count"]
+    return {"files": files, "chunks": chunks, "total_sec": round(total, 3),
+            "files_per_sec": round(files / total, 2), "chunks_per_sec": round(chunks / total, 2),
+            "embeddings_per_sec": round(chunks / embed_seconds[0], 2) if embed_seconds[0] else None}
+
+def bench_stages(app, probes, n_queries, seed=0):
+    """Per-stage latency of the retrieval path, one uncached question at a time."""
+    from bm25 import reciprocal_rank_fusion
+    from rag_index import search_index
+    from rag_prompt import pack_context
+
+    index, docs, metadata, author_filters = app.faiss_store
+    rng = random.Random(seed)
+    authors = ["All"] + list(metadata.authors)
+    stages = {name: [] for name in ("filter", "embed", "search_dense", "search_bm25", "fuse", "rerank", "context")}
+    hits = answerable = 0
+    sample = [rng.choice(probes) for _ in range(n_queries)]
+    for sentence, rel in sample:
+        words = sentence.rstrip(".").split()
+        question = " ".join(rng.sample(words, max(3, len(words) // 2)))
+        author = rng.choice(authors)
+
+        t0 = time.perf_counter()
+        author_filter = author_filters.get(author.lower()) if author != "All" else None
+        stages["filter"].append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        q_emb = app.embedder.get().encode([question])
+        stages["embed"].append(time.perf_counter() - t0)
+
+        n_results = app.RERANK_CANDIDATES if app.reranker is not None else app.TOP_K
+        k = max(app.HYBRID_CANDIDATES, n_results) if app.bm25_index is not None and app.HYBRID_SEARCH else n_results
+        t0 = time.perf_counter()
+        _, I = search_index(index, q_emb, k, author_filter, app.NPROBE, app.EF_SEARCH)
+        dense = [int(i) for i in I[0] if i >= 0]
+        stages["search_dense"].append(time.perf_counter() - t0)
+
+        ids = dense[:n_results]
+        if app.bm25_index is not None and app.HYBRID_SEARCH:
+            t0 = time.perf_counter()
+            lexical = app.bm25_index.search(question, k, author_filter)[1].tolist()
+            stages["search_bm25"].append(time.perf_counter() - t0)
+            t0 = time.perf_counter()
+            ids = reciprocal_rank_fusion([dense, lexical], [app.DENSE_WEIGHT, app.BM25_WEIGHT], app.RRF_K, n_results)
+            stages["fuse"].append(time.perf_counter() - t0)
+
+        if app.reranker is not None:
+            t0 = time.perf_counter()
+            ids = app.reranker.rerank(question, ids, docs.__getitem__, app.TOP_K)
+            stages["rerank"].append(time.perf_counter() - t0)
+        ids = ids[:app.TOP_K]
+
+        t0 = time.perf_counter()
+        pack_context([(docs[i], metadata[i]) for i in ids], app.count_tokens, app.CONTEXT_TOKENS)
+        stages["context"].append(time.perf_counter() - t0)
+
+        if author in ("All", rel.split(os.sep)[0]):
+            answerable += 1
+            hits += any(metadata[i]["file"] == os.path.basename(rel) and metadata[i]["author"] == rel.split(os.sep)[0]
+                        for i in ids)
+    return {"stages": {name: latency_summary(values) for name, values in stages.items() if values},
+            "source_hit_rate": round(hits / max(answerable, 1), 4)}
+
+async def _client(app, questions, ttft, totals, updates):
+    for question, author in questions:
+        t0 = time.perf_counter()
+        first = None
+        n_updates = 0
+        async for chat_pairs in app.query_rag_stream(question, author):
+            n_updates += 1
+            answer = chat_pairs[-1][1] if chat_pairs else ""
+            if first is None and answer and not answer.startswith("⏳"):
+                first = time.perf_counter() - t0
+        totals.append(time.perf_counter() - t0)
+        ttft.append(first if first is not None else totals[-1])
+        updates.append(n_updates)
+
+async def bench_load(app, probes, concurrency_levels, requests_per_client, seed=0):
+    """One run per concurrency level, all on one event loop (the app's Ollama client and gate live on it)."""
+    runs = []
+    for concurrency in concurrency_levels:
+        print(f"Load: {concurrency} concurrent clients...")
+        run = await _load_run(app, probes, concurrency, requests_per_client, seed)
+        print(f"  {run['requests_per_sec']} req/s, ttft {json.dumps(run['ttft'])}")
+        runs.append(run)
+    return runs
+
+async def _load_run(app, probes, concurrency, requests_per_client, seed):
+    rng = random.Random(seed)
+    ttft, totals, updates = [], [], []
+    clients = []
+    for _ in range(concurrency):
+        questions = [(rng.choice(probes)[0], "All") for _ in range(requests_per_client)]
+        clients.append(_client(app, questions, ttft, totals, updates))
+    t0 = time.perf_counter()
+    await asyncio.gather(*clients)
+    wall = time.perf_counter() - t0
+    return {"concurrency": concurrency, "requests": len(totals), "wall_sec": round(wall, 3),
+            "requests_per_sec": round(len(totals) / wall, 3),
+            "ttft": latency_summary(ttft), "total": latency_summary(totals),
+            "ui_updates_per_request": round(sum(updates) / max(len(updates), 1), 1)}
+
+# ---------------- REPORTING ----------------
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {"git_commit": commit, "python": platform.python_version(), "platform": platform.platform(),
+            "cpus": os.cpu_count(), "time": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def flatten(results, prefix=""):
+    flat = {}
+    if isinstance(results, dict):
+        for key, value in results.items():
+            flat.update(flatten(value, f"{prefix}{key}."))
+    elif isinstance(results, list):
+        for item in results:
+            label = f"c{item['concurrency']}" if isinstance(item, dict) and "concurrency" in item else str(len(flat))
+            flat.update(flatten(item, f"{prefix}{label}."))
+    elif isinstance(results, (int, float)) and not isinstance(results, bool):
+        flat[prefix.rstrip(".")] = results
+    return flat
+
+def compare(results, baseline, tolerance):
+    """Print metric changes vs baseline; return names of latencies/throughputs that regressed."""
+    new, old = flatten(results), flatten(baseline)
+    regressions = []
+    for name in sorted(set(new) & set(old)):
+        higher_is_better = name.endswith("per_sec") or name.endswith("hit_rate")
+        lower_is_better = not higher_is_better and (name.endswith("_ms") or name.endswith("_sec"))
+        if not (lower_is_better or higher_is_better) or not old[name]:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        worse = change < -tolerance if higher_is_better else change > tolerance
+        if worse:
+            regressions.append(name)
+        print(f"{'!!' if worse else '  '} {name:<48} {old[name]:>12} -> {new[name]:>12} ({change:+.1%})")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--app", default="app_rag", help="app module whose pipeline is benchmarked")
+    parser.add_argument("--work-dir", default="bench_work")
+    parser.add_argument("--authors", type=int, default=4)
+    parser.add_argument("--books", type=int, default=5, help="books per author")
+    parser.add_argument("--paragraphs", type=int, default=200, help="paragraphs per book")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--requests-per-client", type=int, default=4)
+    parser.add_argument("--tokens-per-sec", type=float, default=50.0, help="fake Ollama streaming rate")
+    parser.add_argument("--answer-tokens", type=int, default=100)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="relative change counted as a regression")
+    parser.add_argument("--serve-ollama", type=int, metavar="PORT", help="only run the fake Ollama server")
+    args = parser.parse_args()
+
+    if args.serve_ollama is not None:
+        server = start_fake_ollama(args.serve_ollama, args.tokens_per_sec, args.answer_tokens)
+        print(f"Fake Ollama on http://127.0.0.1:{server.server_address[1]} (Ctrl+C to stop)")
+        threading.Event().wait()
+
+    # The app creates its Ollama client at import, so the fake server must be up first
+    server = start_fake_ollama(0, args.tokens_per_sec, args.answer_tokens)
+    os.environ["OLLAMA_HOST"] = f"http://127.0.0.1:{server.server_address[1]}"
+    app = importlib.import_module(args.app)
+
+    from bm25 import load_bm25
+    from history_store import HistoryStore
+    from query_cache import QueryCache
+    from rag_store import load_store
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    corpus_dir = os.path.join(args.work_dir, "corpus")
+    store_dir = os.path.join(args.work_dir, "store")
+    probes = generate_corpus(corpus_dir, args.authors, args.books, args.paragraphs)
+    # same warm state as a server that has finished starting up
+    app.warmup.start()
+    app.warmup.wait()
+
+    results = {"environment": environment(),
+               "config": {key: value for key, value in vars(args).items() if key not in ("json", "baseline")}}
+    print("Ingesting synthetic corpus...")
+    results["ingestion"] = bench_ingestion(app, corpus_dir, store_dir)
+    print(json.dumps(results["ingestion"]))
+
+    app.faiss_store = load_store(store_dir)
+    app.bm25_index = load_bm25(store_dir, app.faiss_store[1].chunk_ids)
+    # every question misses the caches; history goes to the work dir
+    app.query_cache = QueryCache(1, 0)
+    app.history = HistoryStore(os.path.join(args.work_dir, "history.sqlite3"))
+
+    print("Timing query stages...")
+    results["query"] = bench_stages(app, probes, args.queries)
+    for name, summary in results["query"]["stages"].items():
+        print(f"  {name:<13} {json.dumps(summary)}")
+
+    results["load"] = asyncio.run(bench_load(app, probes, args.concurrency, args.requests_per_client))
+    app.history.flush()
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"❌ {len(regressions)} regressions beyond {args.tolerance:.0%}")
+            sys.exit(1)
+        print("✅ No regressions")
+
+if __name__ == "__main__":
+    main()
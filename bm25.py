@@ -0,0 +1,160 @@
+"""BM25 inverted index over the chunk store, for exact-term matches the embeddings miss
+(names, Sanskrit terms, verse references).
+
+    <store>/bm25.json              k1, b, average chunk length, row and term counts
+    <store>/bm25_terms.bin         sorted vocabulary, UTF-8, back to back
+    <store>/bm25_term_offsets.npy  int64[T+1] byte offsets into bm25_terms.bin
+    <store>/bm25_offsets.npy       int64[T+1] slice of each term's postings
+    <store>/bm25_rows.npy          int32 store rows containing the term, ascending per term
+    <store>/bm25_tfs.npy           uint16 term frequency in that row
+    <store>/bm25_lengths.npy       int32[N] tokens per row
+
+StoreWriter feeds every chunk through BM25Builder as it is written, so the index is rebuilt
+with each commit at the cost of one tokenization pass. Everything is opened with mmap and a
+query term is found by binary search over the sorted vocabulary, so loading does no per-term work.
+"""
+from array import array
+from bisect import bisect_left
+import json
+import logging
+import mmap
+import os
+import re
+import unicodedata
+
+import numpy as np
+
+# word characters plus combining marks used by Indic scripts (matras, virama, nukta)
+TOKEN = re.compile(r"[\w\u0900-\u0dff]+")
+
+def tokenize(text):
+    """Lower-cased word tokens with Latin diacritics folded (ātman -> atman)."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = re.sub(r"[\u0300-\u036f]", "", text)
+    return TOKEN.findall(text)
+
+class BM25Builder:
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self.vocab = {}
+        self.term_codes = array("i")
+        self.rows = array("i")
+        self.tfs = array("H")
+        self.lengths = array("i")
+
+    def add(self, text):
+        """Index the next store row."""
+        row = len(self.lengths)
+        tokens = tokenize(text)
+        self.lengths.append(len(tokens))
+        counts = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for token, tf in counts.items():
+            self.term_codes.append(self.vocab.setdefault(token, len(self.vocab)))
+            self.rows.append(row)
+            self.tfs.append(min(tf, 65535))
+
+    def write(self, store_dir):
+        terms = sorted(self.vocab)
+        remap = np.empty(len(terms), dtype=np.int64)
+        for code, term in enumerate(terms):
+            remap[self.vocab[term]] = code
+        codes = remap[np.frombuffer(self.term_codes, dtype=np.int32)] if len(self.term_codes) else np.empty(0, np.int64)
+        # stable: rows were appended in ascending order and stay that way within each term
+        order = np.argsort(codes, kind="stable")
+        np.save(os.path.join(store_dir, "bm25_rows.npy"), np.frombuffer(self.rows, dtype=np.int32)[order])
+        np.save(os.path.join(store_dir, "bm25_tfs.npy"), np.frombuffer(self.tfs, dtype=np.uint16)[order])
+        np.save(os.path.join(store_dir, "bm25_offsets.npy"),
+                np.searchsorted(codes[order], np.arange(len(terms) + 1)).astype(np.int64))
+
+        encoded = [term.encode("utf-8") for term in terms]
+        with open(os.path.join(store_dir, "bm25_terms.bin"), "wb") as f:
+            f.write(b"".join(encoded))
+        np.save(os.path.join(store_dir, "bm25_term_offsets.npy"),
+                np.concatenate([[0], np.cumsum([len(t) for t in encoded], dtype=np.int64)]).astype(np.int64))
+        lengths = np.frombuffer(self.lengths, dtype=np.int32)
+        np.save(os.path.join(store_dir, "bm25_lengths.npy"), lengths)
+        with open(os.path.join(store_dir, "bm25.json"), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "rows": len(lengths), "terms": len(terms),
+                       "avg_length": float(lengths.mean()) if len(lengths) else 0.0}, f)
+
+class _Terms:
+    """Sorted vocabulary as a sequence of str, decoded from the mmapped blob on access."""
+
+    def __init__(self, blob_path, offsets_path):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self._file = open(blob_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self._blob[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    def find(self, term):
+        i = bisect_left(self, term)
+        return i if i < len(self) and self[i] == term else None
+
+class BM25Index:
+    def __init__(self, store_dir, chunk_ids):
+        with open(os.path.join(store_dir, "bm25.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.k1, self.b, self.avg_length = meta["k1"], meta["b"], meta["avg_length"] or 1.0
+        self.chunk_ids = chunk_ids
+        self.terms = _Terms(os.path.join(store_dir, "bm25_terms.bin"), os.path.join(store_dir, "bm25_term_offsets.npy"))
+        self.offsets = np.load(os.path.join(store_dir, "bm25_offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(store_dir, "bm25_rows.npy"), mmap_mode="r")
+        self.tfs = np.load(os.path.join(store_dir, "bm25_tfs.npy"), mmap_mode="r")
+        self.lengths = np.load(os.path.join(store_dir, "bm25_lengths.npy"), mmap_mode="r")
+
+    def search(self, query, k, author_filter=None):
+        """Top-k (scores, chunk ids) for the query text, restricted to author_filter's chunks if given."""
+        n = len(self.lengths)
+        row_parts, score_parts = [], []
+        for term in set(tokenize(query)):
+            code = self.terms.find(term)
+            if code is None:
+                continue
+            start, end = self.offsets[code], self.offsets[code + 1]
+            rows = np.asarray(self.rows[start:end])
+            tf = np.asarray(self.tfs[start:end], dtype=np.float32)
+            idf = np.log(1.0 + (n - len(rows) + 0.5) / (len(rows) + 0.5))
+            norm = self.k1 * (1.0 - self.b + self.b * np.asarray(self.lengths[rows]) / self.avg_length)
+            row_parts.append(rows)
+            score_parts.append(idf * tf * (self.k1 + 1.0) / (tf + norm))
+        if not row_parts:
+            return np.empty(0, np.float32), np.empty(0, np.int64)
+
+        rows, inverse = np.unique(np.concatenate(row_parts), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+        ids = np.asarray(self.chunk_ids[rows], dtype=np.int64)
+        if author_filter is not None:
+            # binary search in the author's sorted ids: O(matches * log), never a pass over all of them
+            allowed = author_filter.ids
+            keep = allowed[np.minimum(np.searchsorted(allowed, ids), len(allowed) - 1)] == ids
+            ids, scores = ids[keep], scores[keep]
+        if len(ids) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            ids, scores = ids[top], scores[top]
+        order = np.argsort(-scores, kind="stable")
+        return scores[order], ids[order]
+
+def load_bm25(store_dir, chunk_ids):
+    """BM25Index for the store, or None for stores built before it existed."""
+    if not os.path.exists(os.path.join(store_dir, "bm25.json")):
+        logging.warning(f"No BM25 index in {store_dir}; rebuild the store to enable hybrid retrieval")
+        return None
+    return BM25Index(store_dir, chunk_ids)
+
+def reciprocal_rank_fusion(rankings, weights, k=60, limit=None):
+    """Fuse ranked id lists: score(id) = sum of weight / (k + rank) over the lists containing it."""
+    scores = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + weight / (k + rank + 1)
+    fused = sorted(scores, key=scores.get, reverse=True)
+    return fused[:limit] if limit is not None else fused
@@ -0,0 +1,156 @@
+"""Chunkers turn one extracted source text into a list of chunk strings.
+
+SentenceChunker packs whole sentences into chunks of at most max_tokens, measured with the
+embedder's own tokenizer so nothing is silently truncated at embedding time. It prefers to end
+a chunk at a paragraph break, repeats the last overlap_tokens worth of sentences at the start
+of the next chunk, drops page headers/footers that repeat across PDF pages, and drops chunks
+that are duplicates of an earlier one in the same file.
+
+CharChunker is the old fixed-size character split, kept for comparison.
+"""
+from collections import Counter
+import hashlib
+import math
+import re
+
+PAGE_BREAK = "\f"  # extract_text separates PDF pages with a form feed
+
+SENTENCE_END = re.compile(r"(?<=[.!?।॥])[\"'”’)\]]*\s+")
+PAGE_NUMBER = re.compile(r"^[\s\-–—\[\(]*(page\s*)?(\d+|[ivxlc]{1,7})(\s*(of|/)\s*\d+)?[\s\-–—\]\)]*$", re.I)
+
+def _line_key(line):
+    # page numbers inside a running header don't make it a different header
+    return re.sub(r"\s+", " ", re.sub(r"\d+", "#", line)).strip().lower()
+
+def strip_boilerplate(text, edge_lines=3, min_pages=3, min_share=0.3, max_line=100):
+    """Drop page-number lines and short lines that repeat on many pages, both near page edges.
+
+    Text without page breaks (plain .txt sources) is returned as is: a lone "47" or "I" there
+    is a verse number or a line of verse, not a page number.
+    """
+    if PAGE_BREAK not in text:
+        return text
+    pages = [page.split("\n") for page in text.split(PAGE_BREAK)]
+    repeated = set()
+    if len(pages) >= min_pages:
+        counts = Counter()
+        for lines in pages:
+            edges = [l for l in lines if l.strip()]
+            counts.update({_line_key(l) for l in edges[:edge_lines] + edges[-edge_lines:] if len(l) <= max_line})
+        threshold = max(min_pages, min_share * len(pages))
+        repeated = {key for key, n in counts.items() if n >= threshold}
+    kept = []
+    for lines in pages:
+        filled = [i for i, l in enumerate(lines) if l.strip()]
+        edges = set(filled[:edge_lines] + filled[-edge_lines:])
+        kept.append("\n".join(l for i, l in enumerate(lines)
+                              if i not in edges or not (PAGE_NUMBER.match(l) or _line_key(l) in repeated)))
+    return "\n".join(kept)
+
+def split_paragraphs(text):
+    """Paragraphs as lists of sentences; hard line wraps inside a paragraph are joined."""
+    text = re.sub(r"(\w)-\n(\w)", r"\1\2", text)
+    paragraphs = []
+    for block in re.split(r"\n\s*\n", text):
+        block = re.sub(r"\s+", " ", block).strip()
+        if block:
+            paragraphs.append([s for s in SENTENCE_END.split(block) if s.strip()])
+    return paragraphs
+
+def dedupe(chunks):
+    seen, unique = set(), []
+    for chunk in chunks:
+        key = hashlib.sha1(re.sub(r"\s+", " ", chunk).strip().lower().encode("utf-8")).digest()
+        if key not in seen:
+            seen.add(key)
+            unique.append(chunk)
+    return unique
+
+class SentenceChunker:
+    def __init__(self, count_tokens, max_tokens=126, overlap_tokens=24, min_fill=0.5):
+        self.count_tokens = count_tokens  # list of strings -> list of token counts
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+
+    @property
+    def key(self):
+        """Identifies the chunking settings; files chunked with other settings are re-chunked."""
+        # bump the trailing version when the chunk text for the same settings changes
+        return f"sentence:{self.max_tokens}:{self.overlap_tokens}:{self.min_fill}:2"
+
+    def _split_long(self, sentence, tokens):
+        # a single sentence over budget is cut into roughly equal word runs
+        words = sentence.split()
+        n = math.ceil(tokens / self.max_tokens) + 1
+        step = math.ceil(len(words) / n)
+        return [" ".join(words[i:i + step]) for i in range(0, len(words), step)]
+
+    def __call__(self, text):
+        paragraphs = split_paragraphs(strip_boilerplate(text))
+        sentences = [s for p in paragraphs for s in p]
+        if not sentences:
+            return []
+        counts = iter(self.count_tokens(sentences))
+
+        units = []  # (sentence, tokens, starts a paragraph)
+        for paragraph in paragraphs:
+            for j, sentence in enumerate(paragraph):
+                tokens = next(counts)
+                if tokens <= self.max_tokens:
+                    units.append((sentence, tokens, j == 0))
+                    continue
+                pieces = self._split_long(sentence, tokens)
+                for k, (piece, n) in enumerate(zip(pieces, self.count_tokens(pieces))):
+                    units.append((piece, n, j == 0 and k == 0))
+
+        paragraph_tokens, rest = [], 0
+        for _, tokens, starts in reversed(units):
+            rest += tokens
+            paragraph_tokens.append(rest)
+            if starts:
+                rest = 0
+        paragraph_tokens.reverse()  # tokens from each unit to the end of its paragraph
+
+        chunks, current, size = [], [], 0
+        for i, (sentence, tokens, starts) in enumerate(units):
+            full = size + tokens > self.max_tokens
+            # close early at a paragraph break rather than splitting the next paragraph
+            early = (starts and size >= self.min_fill * self.max_tokens
+                     and size + paragraph_tokens[i] > self.max_tokens)
+            if current and (full or early):
+                chunks.append(self._join(current))
+                overlap, o_size = [], 0
+                for unit in reversed(current[1:]):
+                    if o_size + unit[1] > self.overlap_tokens or o_size + unit[1] + tokens > self.max_tokens:
+                        break
+                    overlap.insert(0, unit)
+                    o_size += unit[1]
+                current, size = overlap, o_size
+            current.append((sentence, tokens, starts))
+            size += tokens
+        if current:
+            chunks.append(self._join(current))
+        return dedupe(chunks)
+
+    @staticmethod
+    def _join(units):
+        text = ""
+        for sentence, _, starts in units:
+            text += ("\n\n" if starts else " ") + sentence if text else sentence
+        return text
+
+class CharChunker:
+    def __init__(self, size=1000):
+        self.size = size
+
+    @property
+    def key(self):
+        return f"chars:{self.size}"
+
+    def __call__(self, text):
+        return [text[i:i + self.size] for i in range(0, len(text), self.size)]
+
+def tokenizer_counter(tokenizer):
+    """Token counts without special tokens, for a HuggingFace tokenizer."""
+    return lambda texts: [len(ids) for ids in tokenizer(list(texts), add_special_tokens=False)["input_ids"]]
@@ -0,0 +1,149 @@
+"""Sentence embedding backends behind one interface, with a parity check against fp32.
+
+    torch       SentenceTransformer in full-precision PyTorch (the original)
+    onnx        the same model exported to ONNX Runtime
+    onnx_int8   ONNX with int8 dynamically quantized weights
+
+ONNX exports are made once with sentence-transformers' ONNX backend (needs
+sentence-transformers>=3.2 with optimum and onnxruntime) and kept under onnx_models/.
+threads sets PyTorch's intra-op threads or the ONNX Runtime session's.
+
+Check a backend on your corpus before switching (cosine to fp32, recall@K, texts/sec):
+    python embedders.py --store faiss_store_author --backends onnx onnx_int8
+"""
+import argparse
+import json
+import logging
+import os
+import re
+import time
+
+import numpy as np
+
+BACKENDS = ("torch", "onnx", "onnx_int8")
+
+class Embedder:
+    def __init__(self, model, backend):
+        self.model = model
+        self.backend = backend
+
+    @property
+    def tokenizer(self):
+        return self.model.tokenizer
+
+    @property
+    def max_seq_length(self):
+        return self.model.max_seq_length
+
+    def encode(self, texts, batch_size=32):
+        """float32 [len(texts), dim]."""
+        return self.model.encode(list(texts), batch_size=batch_size, convert_to_numpy=True).astype(np.float32)
+
+def _onnx_model(model_name, int8, threads, cache_dir, quantization):
+    import onnxruntime as ort
+    from sentence_transformers import SentenceTransformer
+
+    local_dir = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+    file_name = f"onnx/model_qint8_{quantization}.onnx" if int8 else "onnx/model.onnx"
+    if not os.path.exists(os.path.join(local_dir, "onnx", "model.onnx")):
+        logging.info(f"Exporting {model_name} to ONNX in {local_dir}")
+        SentenceTransformer(model_name, backend="onnx").save_pretrained(local_dir)
+    if int8 and not os.path.exists(os.path.join(local_dir, file_name)):
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        logging.info(f"Quantizing {model_name} to int8 ({quantization})")
+        export_dynamic_quantized_onnx_model(SentenceTransformer(local_dir, backend="onnx"), quantization, local_dir)
+
+    options = ort.SessionOptions()
+    if threads:
+        options.intra_op_num_threads = threads
+        options.inter_op_num_threads = 1
+    return SentenceTransformer(local_dir, backend="onnx",
+                               model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider",
+                                             "session_options": options})
+
+def load_embedder(model_name, backend="torch", threads=None, cache_dir="onnx_models", quantization="avx2"):
+    """Embedder for model_name on the chosen backend; quantization is the int8 target ("avx2", "avx512_vnni", "arm64")."""
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown embedding backend {backend!r}, expected one of {BACKENDS}")
+    if backend == "torch":
+        import torch
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            torch.set_num_threads(threads)
+        model = SentenceTransformer(model_name)
+    else:
+        model = _onnx_model(model_name, backend == "onnx_int8", threads, cache_dir, quantization)
+    return Embedder(model, backend)
+
+def cache_name(model_name, backend):
+    """Embedding cache namespace: vectors from different backends differ slightly, so they are kept apart."""
+    return model_name if backend == "torch" else f"{model_name}:{backend}"
+
+# ---------------- PARITY CHECK ----------------
+def _unit(vectors):
+    return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+def _top_k(corpus, queries, k):
+    from rag_index import create_index, search_index
+
+    _, I = search_index(create_index(corpus, "flat"), queries, k)
+    return I
+
+def timed_encode(embedder, texts, batch_size):
+    t0 = time.perf_counter()
+    vectors = embedder.encode(texts, batch_size)
+    return vectors, len(texts) / (time.perf_counter() - t0)
+
+def parity(model_name, texts, queries, backends, k=3, threads=None, batch_size=64):
+    """Compare each backend's vectors and top-k neighbours with the fp32 torch reference."""
+    reference = load_embedder(model_name, "torch", threads)
+    ref_corpus, ref_rate = timed_encode(reference, texts, batch_size)
+    ref_queries, _ = timed_encode(reference, queries, batch_size)
+    ref_top = _top_k(ref_corpus, ref_queries, k)
+    results = [{"backend": "torch", "texts_per_sec": round(ref_rate, 1)}]
+    for backend in backends:
+        candidate = load_embedder(model_name, backend, threads)
+        corpus, rate = timed_encode(candidate, texts, batch_size)
+        cand_queries, _ = timed_encode(candidate, queries, batch_size)
+        cosine = np.sum(_unit(corpus) * _unit(ref_corpus), axis=1)
+        top = _top_k(corpus, cand_queries, k)
+        recall = sum(len(set(a) & set(b)) for a, b in zip(top, ref_top)) / ref_top.size
+        results.append({"backend": backend, "texts_per_sec": round(rate, 1),
+                        "speedup": round(rate / ref_rate, 2),
+                        "cosine_mean": round(float(cosine.mean()), 5), "cosine_min": round(float(cosine.min()), 5),
+                        f"recall_at_{k}": round(recall, 4)})
+    return results
+
+def main():
+    from rag_store import load_store
+
+    parser = argparse.ArgumentParser(description="Cosine agreement, recall@K and speed of embedding backends vs fp32")
+    parser.add_argument("--store", default="faiss_store_author")
+    parser.add_argument("--model", default="sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS[1:], default=list(BACKENDS[1:]))
+    parser.add_argument("--sample", type=int, default=2000, help="chunks embedded from the store")
+    parser.add_argument("--queries", type=int, default=200, help="chunks reused as queries (their first sentence)")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--threads", type=int)
+    parser.add_argument("--json", help="also write results to this file")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+
+    _, docs, _, _ = load_store(args.store)
+    rng = np.random.default_rng(0)
+    rows = rng.choice(len(docs), min(args.sample, len(docs)), replace=False)
+    texts = [docs.at(row) for row in rows]
+    queries = [re.split(r"(?<=[.!?।])\s", text, maxsplit=1)[0] for text in texts[:args.queries]]
+    results = parity(args.model, texts, queries, args.backends, args.k, args.threads)
+
+    print(f"{len(texts)} chunks, {len(queries)} queries, recall@{args.k} vs torch fp32")
+    for r in results:
+        print("  " + ", ".join(f"{key}={value}" for key, value in r.items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
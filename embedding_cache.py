@@ -0,0 +1,159 @@
+"""Persistent embedding cache keyed by (model name, chunk content hash).
+
+    <cache_dir>/<model>/meta.json     model name and vector dimension
+    <cache_dir>/<model>/keys.bin      16-byte sha256 prefix of each cached chunk, one per row
+    <cache_dir>/<model>/vectors.f32   float32 [rows, dim], appended in the same order
+
+Rows are only ever appended, and hits are read back through a memory map. Every build
+marks the rows it uses; close() compacts the files down to the rows that were used when
+the cache is over max_entries, so vectors of chunks that no longer exist are evicted.
+"""
+import hashlib
+import json
+import logging
+import os
+import re
+
+import numpy as np
+
+KEY_BYTES = 16
+
+def content_key(text):
+    return hashlib.sha256(text.encode("utf-8")).digest()[:KEY_BYTES]
+
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_name, max_entries=2_000_000):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.dir = os.path.join(cache_dir, re.sub(r"[^\w.-]+", "_", model_name))
+        os.makedirs(self.dir, exist_ok=True)
+        self.keys_path = os.path.join(self.dir, "keys.bin")
+        self.vectors_path = os.path.join(self.dir, "vectors.f32")
+        self.meta_path = os.path.join(self.dir, "meta.json")
+
+        self.dim = None
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        else:
+            # meta.json is written first and removed while compacting: without it the rows can't be trusted
+            for path in (self.keys_path, self.vectors_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        self.rows = {}
+        self.used = set()
+        self.hits = self.misses = 0
+        self._vectors = None
+        self._keys_file = self._vectors_file = None
+        self._load_keys()
+
+    def _load_keys(self):
+        if self.dim is None or not os.path.exists(self.keys_path):
+            return
+        with open(self.keys_path, "rb") as f:
+            keys = f.read()
+        n_rows = min(len(keys) // KEY_BYTES, os.path.getsize(self.vectors_path) // (4 * self.dim))
+        # A crash between the two appends leaves one file longer; drop the unmatched tail
+        with open(self.keys_path, "r+b") as f:
+            f.truncate(n_rows * KEY_BYTES)
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(n_rows * 4 * self.dim)
+        self.rows = {keys[i * KEY_BYTES:(i + 1) * KEY_BYTES]: i for i in range(n_rows)}
+
+    def _read_rows(self, rows):
+        if self._vectors is None or len(self._vectors) < len(self.rows):
+            self._flush()
+            self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(self.rows), self.dim))
+        return np.asarray(self._vectors[rows])
+
+    def _append(self, keys, vectors):
+        if self.dim is None:
+            self.dim = vectors.shape[1]
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump({"model": self.model_name, "dim": self.dim}, f)
+        if self._keys_file is None:
+            self._keys_file = open(self.keys_path, "ab")
+            self._vectors_file = open(self.vectors_path, "ab")
+        self._vectors_file.write(np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+        self._keys_file.write(b"".join(keys))
+        for key in keys:
+            self.used.add(self.rows.setdefault(key, len(self.rows)))
+
+    def _flush(self):
+        if self._keys_file is not None:
+            self._vectors_file.flush()
+            self._keys_file.flush()
+
+    def mark_used(self, texts):
+        """Keep these chunks' vectors through the next eviction without reading them."""
+        for text in texts:
+            row = self.rows.get(content_key(text))
+            if row is not None:
+                self.used.add(row)
+
+    def embed(self, texts, encode):
+        """Vectors for texts, calling encode(list of texts) only for the ones not cached yet."""
+        keys = [content_key(t) for t in texts]
+        rows = [self.rows.get(k) for k in keys]
+        miss_idx = [i for i, row in enumerate(rows) if row is None]
+        self.hits += len(texts) - len(miss_idx)
+        self.misses += len(miss_idx)
+
+        out = None
+        hit_idx = [i for i, row in enumerate(rows) if row is not None]
+        if hit_idx:
+            hit_vectors = self._read_rows([rows[i] for i in hit_idx])
+            out = np.empty((len(texts), self.dim), dtype=np.float32)
+            out[hit_idx] = hit_vectors
+            self.used.update(rows[i] for i in hit_idx)
+        if miss_idx:
+            # duplicate chunks inside one batch are encoded once
+            unique = {}
+            for i in miss_idx:
+                unique.setdefault(keys[i], texts[i])
+            new_vectors = np.asarray(encode(list(unique.values())), dtype=np.float32)
+            self._append(list(unique), new_vectors)
+            by_key = dict(zip(unique, new_vectors))
+            if out is None:
+                out = np.empty((len(texts), new_vectors.shape[1]), dtype=np.float32)
+            for i in miss_idx:
+                out[i] = by_key[keys[i]]
+        if out is None:
+            out = np.empty((0, self.dim or 0), dtype=np.float32)
+        return out
+
+    def close(self, evict=True):
+        """Flush appends and, if over max_entries, evict every row this run did not use."""
+        self._flush()
+        if self._keys_file is not None:
+            self._keys_file.close()
+            self._vectors_file.close()
+            self._keys_file = self._vectors_file = None
+        self._vectors = None
+        logging.info(f"Embedding cache {self.model_name}: {self.hits} hits, {self.misses} misses, "
+                     f"{len(self.rows)} entries")
+        if not evict or len(self.rows) <= self.max_entries:
+            return
+        if len(self.used) > self.max_entries:
+            logging.warning(f"Embedding cache: {len(self.used)} entries in use exceed max_entries={self.max_entries}")
+        self._compact(sorted(self.used))
+
+    def _compact(self, keep_rows):
+        keys = [None] * len(self.rows)
+        for key, row in self.rows.items():
+            keys[row] = key
+        vectors = np.memmap(self.vectors_path, dtype=np.float32, mode="r", shape=(len(keys), self.dim))
+        with open(self.keys_path + ".tmp", "wb") as kf, open(self.vectors_path + ".tmp", "wb") as vf:
+            for start in range(0, len(keep_rows), 65536):
+                batch = keep_rows[start:start + 65536]
+                kf.write(b"".join(keys[row] for row in batch))
+                vf.write(np.ascontiguousarray(vectors[batch]).tobytes())
+        del vectors
+        os.remove(self.meta_path)
+        os.replace(self.vectors_path + ".tmp", self.vectors_path)
+        os.replace(self.keys_path + ".tmp", self.keys_path)
+        with open(self.meta_path, "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "dim": self.dim}, f)
+        logging.info(f"Embedding cache: evicted {len(self.rows) - len(keep_rows)} unused entries")
+        self.rows = {keys[row]: new_row for new_row, row in enumerate(keep_rows)}
+        self.used = set(range(len(keep_rows)))
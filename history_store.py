@@ -0,0 +1,208 @@
+"""Question history and flagged answers in one SQLite database (WAL mode).
+
+    questions(id, asked_at, author, question, answer, trace_id)
+    flags(id, question_id, flagged_at, author, question, answer)
+
+Question ids come from the id_blocks counter row: each HistoryStore reserves a block of ids
+in a BEGIN IMMEDIATE transaction and hands them out in memory under a lock, so a caller gets
+its id immediately and several processes can share one database without reusing an id. The
+writer thread reserves the next block while half of the current one is left, so log() (called
+from the event loop) doesn't wait on SQLite's write lock. The rows themselves are written by a BackgroundWriter thread, many per transaction. Flags copy
+the author and Q/A so they can be listed by date and author through their own indexes.
+
+Old text logs import with:  python history_store.py app_history.sqlite3 app_history.txt [flagged_responses.txt]
+"""
+from datetime import datetime
+import logging
+import re
+import sqlite3
+import sys
+import threading
+
+from rag_async import BackgroundWriter
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY,
+    asked_at TEXT NOT NULL,
+    author TEXT,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    trace_id TEXT
+);
+CREATE INDEX IF NOT EXISTS questions_asked_at ON questions (asked_at);
+CREATE TABLE IF NOT EXISTS flags (
+    id INTEGER PRIMARY KEY,
+    question_id INTEGER,
+    flagged_at TEXT NOT NULL,
+    author TEXT,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS flags_flagged_at ON flags (flagged_at);
+CREATE INDEX IF NOT EXISTS flags_author_flagged_at ON flags (author, flagged_at);
+CREATE TABLE IF NOT EXISTS id_blocks (
+    name TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+"""
+
+def timestamp(when=None):
+    """Sortable text timestamp; date range queries compare these as strings."""
+    return (when or datetime.now()).isoformat(sep=" ", timespec="seconds")
+
+def connect(path, isolation_level=""):
+    conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=isolation_level)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    if "trace_id" not in {row[1] for row in conn.execute("PRAGMA table_info(questions)")}:
+        conn.execute("ALTER TABLE questions ADD COLUMN trace_id TEXT")  # databases from before tracing
+    return conn
+
+def reserve_ids(conn, count):
+    """First id of a block of count question ids no other store or process will hand out."""
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT next_id FROM id_blocks WHERE name = 'questions'").fetchone()
+        # MAX(id) is a primary key lookup; it also covers rows imported with explicit ids
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM questions").fetchone()[0]
+        first = max(row[0] if row else 1, max_id + 1)
+        conn.execute("INSERT OR REPLACE INTO id_blocks (name, next_id) VALUES ('questions', ?)", (first + count,))
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    return first
+
+class HistoryStore:
+    def __init__(self, path, max_batch=256, id_block=64):
+        self.path = path
+        self._conn = connect(path)  # only used by the writer thread after this point
+        self._ids_conn = connect(path, isolation_level=None)  # autocommit; reserve_ids opens its own transaction
+        self._lock = threading.Lock()
+        self.id_block = id_block
+        self._next_id = reserve_ids(self._ids_conn, id_block)
+        self._end_id = self._next_id + id_block
+        self._spare = None  # first id of the next block, reserved ahead by the writer thread
+        self._reserving = False
+        self._writer = BackgroundWriter(self._write, max_batch, name="history-writer")
+
+    @staticmethod
+    def _insert(conn, table, row):
+        if table == "questions":
+            conn.execute("INSERT INTO questions (id, asked_at, author, question, answer, trace_id) "
+                         "VALUES (?, ?, ?, ?, ?, ?)", row)
+        else:
+            conn.execute("INSERT INTO flags (question_id, flagged_at, author, question, answer) "
+                         "VALUES (?, ?, ?, ?, ?)", row)
+
+    def _reserve_spare(self):
+        try:
+            first = reserve_ids(self._ids_conn, self.id_block)
+        except sqlite3.Error:
+            logging.exception("Reserving question ids failed, retrying on the next question")
+            first = None
+        with self._lock:
+            self._spare = first
+            self._reserving = False
+
+    def _write(self, items):
+        if any(table == "reserve" for table, _ in items):
+            self._reserve_spare()
+            items = [item for item in items if item[0] != "reserve"]
+            if not items:
+                return
+        try:
+            with self._conn:
+                for table, row in items:
+                    self._insert(self._conn, table, row)
+        except sqlite3.IntegrityError:
+            # one bad row must not take the rest of the batch with it
+            for table, row in items:
+                try:
+                    with self._conn:
+                        self._insert(self._conn, table, row)
+                except sqlite3.IntegrityError as e:
+                    logging.error(f"Dropped {table} row {row[0]}: {e}")
+
+    def log(self, question, answer, author=None, trace_id=None):
+        """Queue a Q/A pair for writing and return its question id."""
+        with self._lock:
+            if self._next_id >= self._end_id:
+                # only if the writer thread fell a whole half block behind
+                first = self._spare if self._spare is not None else reserve_ids(self._ids_conn, self.id_block)
+                self._next_id, self._end_id, self._spare = first, first + self.id_block, None
+            if self._spare is None and not self._reserving and self._end_id - self._next_id <= self.id_block // 2:
+                self._reserving = True
+                self._writer.put(("reserve", None))
+            question_id = self._next_id
+            self._next_id += 1
+            self._writer.put(("questions", (question_id, timestamp(), author, question, answer, trace_id)))
+        return question_id
+
+    def flag(self, question_id, question, answer, author=None):
+        self._writer.put(("flags", (question_id, timestamp(), author, question, answer)))
+
+    def flush(self):
+        """Block until every queued row is committed."""
+        self._writer.flush()
+
+    def flags(self, since=None, until=None, author=None, limit=100):
+        """Newest flagged Q/A pairs, optionally for one author and a [since, until) date range."""
+        clauses, params = [], []
+        if author is not None:
+            clauses.append("author = ?")
+            params.append(author)
+        if since is not None:
+            clauses.append("flagged_at >= ?")
+            params.append(since if isinstance(since, str) else timestamp(since))
+        if until is not None:
+            clauses.append("flagged_at < ?")
+            params.append(until if isinstance(until, str) else timestamp(until))
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        # readers get their own connection; WAL lets them run alongside the writer
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            rows = conn.execute(f"SELECT * FROM flags {where} ORDER BY flagged_at DESC, id DESC LIMIT ?",
+                                params + [limit]).fetchall()
+        finally:
+            conn.close()
+        return [dict(row) for row in rows]
+
+# ---------------- TEXT LOG IMPORT ----------------
+def parse_history_text(text):
+    """(id, asked_at, question, answer) from the old "Qn: ...\\nAn: ... Date of Question ...\\n---" log."""
+    pattern = re.compile(r"^Q(\d+): (.*?)\nA\1: (.*?) Date of Question (\S+ \S+)\n---$", re.S | re.M)
+    for m in pattern.finditer(text):
+        yield int(m.group(1)), m.group(4)[:19], m.group(2), m.group(3)
+
+def parse_flags_text(text):
+    """(flagged_at, question, answer) from the old flagged_responses.txt."""
+    pattern = re.compile(r"^Q: (.*?)\nA: (.*?)\nFlagged at: (\S+ \S+)\n---$", re.S | re.M)
+    for m in pattern.finditer(text):
+        yield m.group(3)[:19], m.group(1), m.group(2)
+
+def import_text_logs(db_path, history_path, flags_path=None):
+    conn = connect(db_path)
+    with open(history_path, "r", encoding="utf-8") as f:
+        rows = list(parse_history_text(f.read()))
+    with conn:
+        conn.executemany("INSERT OR IGNORE INTO questions (id, asked_at, author, question, answer) "
+                         "VALUES (?, ?, NULL, ?, ?)", [(n, ts, q, a) for n, ts, q, a in rows])
+    logging.info(f"Imported {len(rows)} questions from {history_path}")
+    if flags_path:
+        with open(flags_path, "r", encoding="utf-8") as f:
+            flags = list(parse_flags_text(f.read()))
+        with conn:
+            conn.executemany("INSERT INTO flags (question_id, flagged_at, author, question, answer) "
+                             "VALUES (NULL, ?, NULL, ?, ?)", flags)
+        logging.info(f"Imported {len(flags)} flags from {flags_path}")
+    conn.close()
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    if len(sys.argv) not in (3, 4):
+        sys.exit("usage: python history_store.py <db> <app_history.txt> [flagged_responses.txt]")
+    import_text_logs(*sys.argv[1:])
@@ -0,0 +1,177 @@
+"""Per-request stage spans, counters and histograms, exported in the Prometheus text format.
+
+    trace = RequestTrace()
+    with trace.span("embed"):
+        ...
+    trace.finish("answered")   # counts the outcome, observes the total, logs one summary line
+
+Spans use the monotonic perf_counter clock. serve() runs the Gradio app under uvicorn with
+GET /metrics (and optionally GET /ready) next to it; the stdlib-only registry avoids a
+prometheus_client dependency.
+"""
+from contextlib import contextmanager
+import logging
+import threading
+import time
+import uuid
+
+# seconds; from cache hits (~1 ms) to slow generations
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{n}="{str(v)}"' for n, v in zip(names, values)) + "}"
+
+class Counter:
+    def __init__(self, name, doc, labelnames=()):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self.values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, doc, labelnames=(), buckets=STAGE_BUCKETS):
+        self.name, self.doc, self.labelnames = name, doc, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}  # labels -> [bucket counts..., count, sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            series = self.series.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self.series.items()):
+                for bound, count in zip(self.buckets + ("+Inf",), series[:len(self.buckets)] + [series[-2]]):
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames + ('le',), key + (bound,))} {count}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-1]:.6f}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []  # callables returning extra exposition lines at scrape time
+
+    def counter(self, name, doc, labelnames=()):
+        metric = Counter(name, doc, labelnames)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, doc, labelnames=(), buckets=STAGE_BUCKETS):
+        metric = Histogram(name, doc, labelnames, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collect in self.collectors:
+            lines.extend(collect())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("rag_stage_seconds", "Time spent per query stage", ["stage"])
+REQUESTS = REGISTRY.counter("rag_requests_total", "Questions by outcome", ["outcome"])
+
+def cache_stats(query_cache, reranker=None):
+    """Tier -> {"hits", "misses"} for the query cache tiers (and the rerank score cache)."""
+    stats = {tier: {"hits": s["hits"], "misses": s["misses"]} for tier, s in query_cache.stats().items()}
+    if reranker is not None:
+        s = reranker.stats()["score_cache"]
+        stats["rerank_score"] = {"hits": s["hits"], "misses": s["misses"]}
+    return stats
+
+def cache_collector(query_cache, reranker=None, worker_stats=None):
+    """Scrape-time cache counters; worker_stats maps a serving worker's pid to its latest cache_stats()."""
+    def collect():
+        totals = {}
+        for stats in [cache_stats(query_cache, reranker)] + list((worker_stats or {}).values()):
+            for tier, s in stats.items():
+                total = totals.setdefault(tier, {"hits": 0, "misses": 0})
+                total["hits"] += s["hits"]
+                total["misses"] += s["misses"]
+        lines = ["# HELP rag_cache_lookups_total Cache lookups by tier and result",
+                 "# TYPE rag_cache_lookups_total counter"]
+        for tier, s in totals.items():
+            lines.append(f'rag_cache_lookups_total{{tier="{tier}",result="hit"}} {s["hits"]}')
+            lines.append(f'rag_cache_lookups_total{{tier="{tier}",result="miss"}} {s["misses"]}')
+        return lines
+    return collect
+
+class RequestTrace:
+    def __init__(self, trace_id=None):
+        self.trace_id = trace_id or uuid.uuid4().hex[:16]
+        self.start = time.perf_counter()
+        self.stages = {}
+
+    @contextmanager
+    def span(self, stage):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - t0)
+
+    def record(self, stage, seconds):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        STAGE_SECONDS.observe(seconds, stage=stage)
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def finish(self, outcome):
+        total = self.elapsed()
+        STAGE_SECONDS.observe(total, stage="total")
+        REQUESTS.inc(outcome=outcome)
+        spans = ", ".join(f"{stage} {seconds * 1000:.1f} ms" for stage, seconds in self.stages.items())
+        logging.info(f"[trace {self.trace_id}] {outcome} in {total:.2f} sec: {spans}")
+
+def serve(demo, host="0.0.0.0", port=7860, path="/metrics", registry=REGISTRY, ready=None, on_startup=None):
+    """Run the Gradio Blocks app with a Prometheus scrape endpoint at path.
+
+    ready() -> bool backs a /ready probe (503 until true); on_startup runs once the server listens.
+    """
+    from fastapi import FastAPI
+    from fastapi.responses import PlainTextResponse
+    import gradio as gr
+    import uvicorn
+
+    app = FastAPI()
+
+    @app.get(path)
+    def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+    if ready is not None:
+        @app.get("/ready")
+        def readiness():
+            ok = ready()
+            return PlainTextResponse("ready" if ok else "warming up", status_code=200 if ok else 503)
+
+    if on_startup is not None:
+        app.add_event_handler("startup", on_startup)
+
+    app = gr.mount_gradio_app(app, demo.queue(), path="/")
+    uvicorn.run(app, host=host, port=port)
@@ -0,0 +1,67 @@
+"""Coalesce concurrent per-request work into batches.
+
+Each Gradio worker thread calls a MicroBatcher like a function and blocks on its result.
+A background thread takes the first queued item, keeps collecting for up to max_wait_ms or
+until max_batch items are queued, runs fn once on the whole batch and hands every caller its
+own result. Under load many batch-size-1 transformer passes and FAISS searches become one;
+when idle the only cost is max_wait_ms.
+"""
+from concurrent.futures import Future
+import logging
+import queue
+import threading
+import time
+
+class MicroBatcher:
+    def __init__(self, fn, max_batch=32, max_wait_ms=2.0, name="batcher"):
+        self.fn = fn  # list of items -> list of results, same order
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self.batches = self.items = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    def __call__(self, item):
+        future = Future()
+        self._queue.put((item, future))
+        if self._thread is None:
+            self._start()
+        return future.result()
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            try:
+                results = self.fn([item for item, _ in batch])
+            except Exception as e:
+                logging.exception(f"{self.name}: batch of {len(batch)} failed")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0.0}
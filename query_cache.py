@@ -0,0 +1,146 @@
+"""Tiered cache for repeated questions in query_rag_stream.
+
+    1. normalized question          -> query embedding        (skips the embedder)
+    2. (query embedding, author)    -> retrieved chunk ids    (skips the FAISS search)
+    3. optional semantic answers: a new question whose embedding is within a cosine threshold
+       of a cached one, for the same author and LLM model, replays the stored answer
+       (skips Ollama entirely)
+
+Every tier is an LRU with a TTL and a size cap, and counts hits and misses.
+"""
+from collections import OrderedDict
+import hashlib
+import re
+import threading
+import time
+
+import numpy as np
+
+def normalize_question(question):
+    """Case, surrounding punctuation and whitespace don't change the question."""
+    return re.sub(r"\s+", " ", question.strip().strip("?!.。।").strip()).lower()
+
+class LRUCache:
+    def __init__(self, maxsize=4096, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (self.ttl is None or time.monotonic() - item[0] < self.ttl):
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic(), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+class SemanticAnswerCache:
+    """Answers by (author, model), looked up by cosine similarity of the question embedding."""
+
+    def __init__(self, threshold=0.95, maxsize=1000, ttl=3600):
+        self.threshold = threshold
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()  # (author, model) -> list of (time, unit vector, answer)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    @staticmethod
+    def _unit(q_emb):
+        v = np.asarray(q_emb, dtype=np.float32).reshape(-1)
+        return v / (np.linalg.norm(v) or 1.0)
+
+    def get(self, q_emb, author, model):
+        with self._lock:
+            now = time.monotonic()
+            entries = [e for e in self._entries.get((author, model), []) if now - e[0] < self.ttl]
+            self._entries[(author, model)] = entries
+            if entries:
+                sims = np.stack([e[1] for e in entries]) @ self._unit(q_emb)
+                best = int(np.argmax(sims))
+                if sims[best] >= self.threshold:
+                    self.hits += 1
+                    return entries[best][2]
+            self.misses += 1
+            return None
+
+    def put(self, q_emb, author, model, answer):
+        with self._lock:
+            self._entries.setdefault((author, model), []).append((time.monotonic(), self._unit(q_emb), answer))
+            self._entries.move_to_end((author, model))
+            # evict the oldest answers first
+            while len(self) > self.maxsize:
+                oldest = min(self._entries, key=lambda k: self._entries[k][0][0] if self._entries[k] else -1)
+                if self._entries[oldest]:
+                    self._entries[oldest].pop(0)
+                if not self._entries[oldest]:
+                    del self._entries[oldest]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+class QueryCache:
+    def __init__(self, maxsize=4096, ttl=3600, answer_threshold=None, answer_maxsize=1000):
+        self.embeddings = LRUCache(maxsize, ttl)
+        self.retrievals = LRUCache(maxsize, ttl)
+        self.answers = SemanticAnswerCache(answer_threshold, answer_maxsize, ttl) if answer_threshold else None
+
+    def embed(self, question, encode):
+        """Query embedding [1, dim] for question, encoding only on a miss."""
+        key = normalize_question(question)
+        q_emb = self.embeddings.get(key)
+        if q_emb is None:
+            q_emb = encode(question)
+            self.embeddings.put(key, q_emb)
+        return q_emb
+
+    def retrieve(self, q_emb, author, search, generation=0):
+        """Chunk ids for (q_emb, author) in store generation, calling search() only on a miss."""
+        key = (generation, hashlib.sha1(np.ascontiguousarray(q_emb).tobytes()).digest(), author.lower())
+        ids = self.retrievals.get(key)
+        if ids is None:
+            ids = tuple(search())
+            self.retrievals.put(key, ids)
+        return ids
+
+    def answer(self, q_emb, author, model):
+        return self.answers.get(q_emb, author.lower(), model) if self.answers is not None else None
+
+    def store_answer(self, q_emb, author, model, answer):
+        if self.answers is not None:
+            self.answers.put(q_emb, author.lower(), model, answer)
+
+    def clear(self):
+        """Drop everything, e.g. after the index was rebuilt."""
+        for tier in (self.embeddings, self.retrievals, self.answers):
+            if tier is not None:
+                tier.clear()
+
+    def stats(self):
+        tiers = {"embedding": self.embeddings, "retrieval": self.retrievals, "answer": self.answers}
+        return {name: {"hits": tier.hits, "misses": tier.misses, "size": len(tier)}
+                for name, tier in tiers.items() if tier is not None}
@@ -0,0 +1,142 @@
+"""Serving helpers for the asyncio query path.
+
+GenerationGate caps how many Ollama generations run at once and queues everybody else in
+arrival order, telling each waiting user their position. BackgroundWriter takes file writes
+(history, flags) off the request path onto a single writer thread. coalesce() batches a
+token stream so the UI gets one update per batch instead of one per token.
+"""
+import asyncio
+from collections import deque
+import logging
+import queue
+import threading
+import time
+
+class QueueFull(Exception):
+    pass
+
+class GenerationGate:
+    """FIFO admission control for LLM generations on one event loop."""
+
+    def __init__(self, max_concurrent, max_queue=None):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.active = 0
+        self._waiting = deque()
+        self._changed = None
+
+    def _event(self):
+        # created lazily so it belongs to the serving event loop
+        if self._changed is None:
+            self._changed = asyncio.Event()
+        return self._changed
+
+    def _notify(self):
+        changed, self._changed = self._event(), asyncio.Event()
+        changed.set()
+
+    @property
+    def queued(self):
+        return len(self._waiting)
+
+    async def admit(self):
+        """Yield this caller's 1-based queue position whenever it changes; return once admitted.
+
+        Raises QueueFull when max_queue callers are already waiting. Call release() after the
+        generation of every admitted caller.
+        """
+        if self.active < self.max_concurrent and not self._waiting:
+            self.active += 1
+            return
+        if self.max_queue is not None and len(self._waiting) >= self.max_queue:
+            raise QueueFull()
+        ticket = object()
+        self._waiting.append(ticket)
+        admitted = False
+        try:
+            last = None
+            while True:
+                changed = self._event()
+                position = self._waiting.index(ticket) + 1
+                if position == 1 and self.active < self.max_concurrent:
+                    self._waiting.popleft()
+                    self.active += 1
+                    admitted = True
+                    self._notify()
+                    return
+                if position != last:
+                    last = position
+                    yield position
+                await changed.wait()
+        finally:
+            if not admitted and ticket in self._waiting:
+                # user left the queue (disconnect / cancel)
+                self._waiting.remove(ticket)
+                self._notify()
+
+    def release(self):
+        self.active -= 1
+        self._notify()
+
+class BackgroundWriter:
+    """Queue items from any thread or coroutine; one daemon thread passes them to write_batch in batches."""
+
+    def __init__(self, write_batch, max_batch=256, name="background-writer"):
+        self.write_batch = write_batch
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def put(self, item):
+        self._queue.put(item)
+
+    def flush(self):
+        """Block until everything queued so far has been written."""
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self.write_batch(batch)
+            except Exception:
+                logging.exception(f"{self._thread.name}: failed to write {len(batch)} items")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+async def coalesce(stream, interval, max_items):
+    """Re-yield an async stream as lists of items, at most every interval seconds or max_items items.
+
+    The first item goes out at once (time to first token is unchanged). A partial batch is also
+    flushed when the stream stalls for interval, without cancelling the pending read.
+    """
+    items = stream.__aiter__()
+    batch, last_flush = [], None
+    pending = asyncio.ensure_future(items.__anext__())
+    try:
+        while True:
+            timeout = max(0.0, interval - (time.monotonic() - last_flush)) if batch else None
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+            if not done:
+                yield batch
+                batch, last_flush = [], time.monotonic()
+                continue
+            try:
+                batch.append(pending.result())
+            except StopAsyncIteration:
+                break
+            pending = asyncio.ensure_future(items.__anext__())
+            if last_flush is None or len(batch) >= max_items or time.monotonic() - last_flush >= interval:
+                yield batch
+                batch, last_flush = [], time.monotonic()
+        if batch:
+            yield batch
+    finally:
+        pending.cancel()  # the consumer stopped early
@@ -0,0 +1,282 @@
+"""Full and incremental builds of the RAG store from the App Books folder.
+
+sources.json in the store records size, mtime, sha256 and the chunk id range of every source
+file. An update only hashes files whose size or mtime changed, only extracts and embeds files
+whose content changed, removes the chunks of changed and deleted files from the index by their
+stable ids, and swaps the new store into place atomically.
+
+Ingestion is a streaming pipeline: text extraction runs in a process pool (PyPDF2 is CPU-bound
+and holds the GIL), chunks flow as a generator into fixed-size embedding batches, and each
+batch is appended to the index and the chunk store as soon as it is embedded. Peak memory is
+bounded by the batch size and the pool's read-ahead, not by the corpus.
+
+The apps supply two callbacks:
+    chunk_text(path, text) -> (chunks, metadata dicts)   one source file
+    embed(chunks)          -> float32 array [n, dim]
+and a chunker_key naming the chunking settings, recorded per source file.
+
+Sources ending in .chunks.jsonl are already chunked (saintspeaks/articleprocessor.py --chunks-dir
+writes them): one {"text", "author", "book", "file"} object per line, embedded as they are.
+
+metric/codec choose the index's distance and vector storage (see rag_index.new_index) and
+text_codec the chunk text storage (see rag_store). Changing index_type, metric or codec rebuilds
+the store; a text_codec change is applied to the retained chunks while they are copied.
+
+With an EmbeddingCache, embed is only called for chunks whose text was never embedded by this
+model before; update_store closes the cache, evicting unused entries only after a successful run.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from chunker import PAGE_BREAK
+
+CHUNK_FILE_SUFFIX = ".chunks.jsonl"
+SOURCE_EXTENSIONS = (".txt", ".pdf", CHUNK_FILE_SUFFIX)
+
+# ---------------- EXTRACTION ----------------
+def extract_text(file_path):
+    """Extract text from PDF or TXT, robustly."""
+    if file_path.endswith((".txt", CHUNK_FILE_SUFFIX)):
+        try:
+            with open(file_path, "r", encoding="utf-8", errors="ignore") as f:
+                return f.read()
+        except Exception as e:
+            print(f"⚠️ Skipping TXT {file_path}: {e}")
+            return ""
+    elif file_path.endswith(".pdf"):
+        try:
+            from PyPDF2 import PdfReader
+
+            reader = PdfReader(file_path)
+            # pages stay separated so the chunker can spot repeated headers and footers
+            return PAGE_BREAK.join(page.extract_text() or "" for page in reader.pages)
+        except Exception as e:
+            print(f"⚠️ Skipping PDF {file_path}: {e}")
+            return ""
+    return ""
+
+def read_chunk_file(text):
+    """(chunks, metadata dicts) from a pre-chunked .chunks.jsonl source."""
+    rows = [json.loads(line) for line in text.splitlines() if line.strip()]
+    return ([row["text"] for row in rows],
+            [{"author": row["author"], "book": row["book"], "file": row["file"]} for row in rows])
+
+def extract_parallel(paths, workers):
+    """Yield (path, text) in order, extracting up to 2*workers files ahead in a process pool."""
+    if workers <= 1:
+        for path in paths:
+            yield path, extract_text(path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for path in paths:
+            pending.append((path, pool.submit(extract_text, path)))
+            if len(pending) >= 2 * workers:
+                done_path, future = pending.popleft()
+                yield done_path, future.result()
+        while pending:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+
+# ---------------- SOURCE MANIFEST ----------------
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def scan_sources(folder_path):
+    """Relative path -> {"size", "mtime_ns"} for every source file under folder_path."""
+    sources = {}
+    for root, _, files in os.walk(folder_path):
+        for file in files:
+            if file.endswith(SOURCE_EXTENSIONS):
+                path = os.path.join(root, file)
+                st = os.stat(path)
+                sources[os.path.relpath(path, folder_path)] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+    return sources
+
+def plan_update(folder_path, current, recorded, chunker_key=None):
+    """Split sources into (kept entries, [(path, entry)] to embed, recorded paths to remove).
+
+    Files last chunked with different chunker settings count as changed.
+    """
+    kept, to_embed = {}, []
+    for rel, stat in sorted(current.items()):
+        old = recorded.get(rel)
+        if old and old.get("chunker") != chunker_key:
+            old = None
+        if old and old["size"] == stat["size"] and old["mtime_ns"] == stat["mtime_ns"]:
+            kept[rel] = old
+            continue
+        digest = file_sha256(os.path.join(folder_path, rel))
+        if old and old["sha256"] == digest:
+            kept[rel] = {**old, **stat}  # touched but unchanged
+        else:
+            to_embed.append((rel, {**stat, "sha256": digest}))
+    removed = [rel for rel in recorded if rel not in kept]
+    return kept, to_embed, removed
+
+def chunk_id_range(entry):
+    return np.arange(entry["first_id"], entry["first_id"] + entry["count"], dtype=np.int64)
+
+# ---------------- PIPELINE ----------------
+class StageTimer:
+    """Accumulated seconds and item counts per pipeline stage, logged as throughput at the end."""
+
+    def __init__(self):
+        self.seconds = {}
+        self.items = {}
+
+    def add(self, stage, seconds, items):
+        self.seconds[stage] = self.seconds.get(stage, 0.0) + seconds
+        self.items[stage] = self.items.get(stage, 0) + items
+
+    def log(self):
+        for stage, seconds in self.seconds.items():
+            rate = self.items[stage] / seconds if seconds > 0 else float("inf")
+            logging.info(f"{stage}: {self.items[stage]} in {seconds:.2f} sec ({rate:.1f}/sec)")
+
+def iter_batches(chunk_stream, batch_size):
+    batch = []
+    for item in chunk_stream:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+# ---------------- BUILD / UPDATE ----------------
+def update_store(folder_path, store_dir, chunk_text, embed, index_type="flat", rebuild=False,
+                 workers=None, batch_size=256, embedding_cache=None, chunker_key=None,
+                 metric="l2", codec="float32", text_codec="raw"):
+    """Bring store_dir in line with folder_path; returns False when nothing had to change."""
+    try:
+        changed = _update_store(folder_path, store_dir, chunk_text, embed, index_type, rebuild,
+                                workers, batch_size, embedding_cache, chunker_key, metric, codec, text_codec)
+    except BaseException:
+        if embedding_cache is not None:
+            embedding_cache.close(evict=False)
+        raise
+    if embedding_cache is not None:
+        embedding_cache.close(evict=changed)
+    return changed
+
+def _update_store(folder_path, store_dir, chunk_text, embed, index_type, rebuild, workers, batch_size,
+                  embedding_cache, chunker_key, metric, codec, text_codec):
+    # imported here so extraction workers and tools that only need extract_text skip FAISS
+    import faiss
+    from rag_index import IndexBuilder, index_params, start_update
+    from rag_store import MMAP_FLAG, StoreWriter, load_store, read_manifest, read_sources, recover_store, write_sources
+
+    t0 = time.time()
+    if embedding_cache is not None:
+        encode = embed
+        embed = lambda chunks: embedding_cache.embed(chunks, encode)
+    layout_codec = "pq" if index_type == "ivf_pq" else codec  # PQ is its own compression
+    manifest, recorded = None, {}
+    recover_store(store_dir)
+    if not rebuild and os.path.exists(os.path.join(store_dir, "manifest.json")):
+        manifest, recorded = read_manifest(store_dir), read_sources(store_dir)
+        if not recorded and manifest["count"]:
+            logging.info("Store has no source manifest (converted pickle?), rebuilding from scratch")
+            manifest = None
+        else:
+            old_type = manifest.get("index_type")
+            if old_type is None:
+                # stores from before index_type was recorded: read it back from the index itself
+                old_index = faiss.read_index(os.path.join(store_dir, "index.faiss"), MMAP_FLAG)
+                old_type = index_params(old_index)["index_type"]
+            old_layout = (old_type, manifest.get("metric", "l2"), manifest.get("codec", "float32"))
+            if old_layout != (index_type, metric, layout_codec):
+                logging.info(f"Index layout changed from {'/'.join(old_layout)} to {index_type}/{metric}/{codec}, "
+                             f"rebuilding from scratch")
+                manifest, recorded = None, {}
+
+    kept, to_embed, removed = plan_update(folder_path, scan_sources(folder_path), recorded, chunker_key)
+    logging.info(f"Sources: {len(kept)} unchanged, {len(to_embed)} new or changed, "
+                 f"{len(removed) - sum(rel in recorded for rel, _ in to_embed)} deleted")
+    if manifest is not None and not to_embed and not removed and manifest.get("text_codec", "raw") == text_codec:
+        if kept != recorded:
+            write_sources(store_dir, kept)
+        logging.info("Store is up to date")
+        return False
+
+    writer = StoreWriter(store_dir, text_codec)
+    if manifest is None:
+        builder = IndexBuilder(index_type, spill_path=os.path.join(writer.tmp_dir, "vectors.spill"),
+                               metric=metric, codec=codec)
+        next_id = 0
+    else:
+        # Loaded without mmap: the index is edited before being written back
+        remove_ids = np.concatenate([chunk_id_range(recorded[rel]) for rel in removed] or [np.empty(0, np.int64)])
+        builder = start_update(faiss.read_index(os.path.join(store_dir, "index.faiss")), remove_ids)
+        next_id = manifest["next_chunk_id"]
+
+        # Retained chunks are copied row by row; their vectors are already in the index
+        _, old_docs, old_meta, _ = load_store(store_dir)
+        keep_rows = np.flatnonzero(~np.isin(old_docs.chunk_ids, remove_ids))
+        for row in keep_rows:
+            text = old_docs.at(row)
+            writer.add(old_docs.chunk_ids[row], text, old_meta.at(row))
+            if embedding_cache is not None:
+                embedding_cache.mark_used([text])
+        logging.info(f"Kept {len(keep_rows)} chunks, removed {len(remove_ids)}")
+
+    timer = StageTimer()
+    workers = workers or os.cpu_count() or 1
+
+    def chunk_stream():
+        nonlocal next_id
+        paths = [os.path.join(folder_path, rel) for rel, _ in to_embed]
+        extracted = extract_parallel(paths, workers)
+        for rel, entry in to_embed:
+            t_wait = time.time()
+            _, text = next(extracted)
+            timer.add("Extraction (files)", time.time() - t_wait, 1)
+            t_chunk = time.time()
+            if rel.endswith(CHUNK_FILE_SUFFIX):
+                chunks, metas = read_chunk_file(text)
+            else:
+                chunks, metas = chunk_text(os.path.join(folder_path, rel), text)
+            timer.add("Chunking (chunks)", time.time() - t_chunk, len(chunks))
+            kept[rel] = {**entry, "first_id": next_id, "count": len(chunks), "chunker": chunker_key}
+            for chunk, meta in zip(chunks, metas):
+                yield next_id, chunk, meta
+                next_id += 1
+
+    try:
+        for batch in iter_batches(chunk_stream(), batch_size):
+            ids, chunks, metas = zip(*batch)
+            t_embed = time.time()
+            vectors = embed(list(chunks))
+            timer.add("Embedding (chunks)", time.time() - t_embed, len(batch))
+            t_index = time.time()
+            builder.add(np.asarray(ids, dtype=np.int64), vectors)
+            timer.add("Indexing (vectors)", time.time() - t_index, len(batch))
+            t_write = time.time()
+            for chunk_id, chunk, meta in batch:
+                writer.add(chunk_id, chunk, meta)
+            timer.add("Chunk store writes (chunks)", time.time() - t_write, len(batch))
+        if manifest is None and not len(writer):
+            raise ValueError("No valid .txt or .pdf documents found in the folder.")
+        t_finish = time.time()
+        index = builder.finish()
+        timer.add("Index finish (vectors)", time.time() - t_finish, builder.count)
+    except BaseException:
+        writer.abort()
+        raise
+
+    timer.log()
+    writer.commit(index, kept, next_id)
+    logging.info(f"Total {'build' if manifest is None else 'update'} time: {time.time() - t0:.2f} sec")
+    return True
@@ -0,0 +1,291 @@
+from collections import namedtuple
+import logging
+import math
+import os
+import time
+
+import faiss
+import numpy as np
+
+# ids: sorted int64 chunk ids, id_set: O(1) membership for post-filtering,
+# selector: FAISS IDSelector that restricts the search itself to the author.
+AuthorFilter = namedtuple("AuthorFilter", ["ids", "id_set", "selector"])
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+# cosine = vectors normalized to unit length and searched by inner product
+METRICS = ("l2", "cosine")
+# how flat, ivf_flat and hnsw store each vector: 4, 2 or 1 byte(s) per dimension
+CODECS = {"float32": "Flat", "fp16": "SQfp16", "int8": "SQ8"}
+
+# ---------------- AUTHOR INDEX ----------------
+def build_author_index(metadata):
+    """Map lower-cased author -> sorted int64 array of chunk ids (built once at index time)."""
+    ids_by_author = {}
+    for i, m in enumerate(metadata):
+        ids_by_author.setdefault(m["author"].lower(), []).append(i)
+    return {author: np.asarray(ids, dtype=np.int64) for author, ids in ids_by_author.items()}
+
+class AuthorFilters:
+    """Lower-cased author -> AuthorFilter, each built on first use and then cached.
+
+    Building is proportional to that author's chunk count only, so loading a store stays
+    instant and no request pays anything proportional to the whole corpus.
+    """
+
+    def __init__(self, author_index):
+        self.author_index = author_index
+        self._filters = {}
+
+    def __contains__(self, author):
+        return author in self.author_index
+
+    def __len__(self):
+        return len(self.author_index)
+
+    def get(self, author, default=None):
+        author_filter = self._filters.get(author)
+        if author_filter is None:
+            ids = self.author_index.get(author)
+            if ids is None:
+                return default
+            ids = np.ascontiguousarray(ids, dtype=np.int64)
+            author_filter = AuthorFilter(ids, frozenset(ids.tolist()), faiss.IDSelectorBatch(ids))
+            self._filters[author] = author_filter
+        return author_filter
+
+def build_author_filters(author_index):
+    return AuthorFilters(author_index)
+
+# ---------------- INDEX FACTORY ----------------
+def default_nlist(n_vectors):
+    """Rule of thumb: ~4*sqrt(N) inverted lists, keeping at least 39 training points per list."""
+    return max(1, min(int(4 * math.sqrt(n_vectors)), n_vectors // 39))
+
+def new_index(dim, index_type="flat", n_vectors=None, nlist=None, pq_m=48, pq_bits=8,
+              hnsw_m=32, ef_construction=200, metric="l2", codec="float32"):
+    """Empty FAISS index of the requested type; IVF variants and int8 codes still need training."""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"Unknown index type '{index_type}', expected one of {INDEX_TYPES}")
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}', expected one of {METRICS}")
+    if codec not in CODECS:
+        raise ValueError(f"Unknown codec '{codec}', expected one of {tuple(CODECS)}")
+
+    storage = CODECS[codec]
+    if index_type == "flat":
+        description = storage
+    elif index_type == "hnsw":
+        description = f"HNSW{hnsw_m}" if codec == "float32" else f"HNSW{hnsw_m},{storage}"
+    else:
+        nlist = nlist or default_nlist(n_vectors)
+        if index_type == "ivf_flat":
+            description = f"IVF{nlist},{storage}"
+        else:
+            if codec != "float32":
+                raise ValueError("ivf_pq already compresses its vectors; use codec='float32'")
+            if dim % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} must divide the embedding dimension {dim}")
+            description = f"IVF{nlist},PQ{pq_m}x{pq_bits}"
+    index = faiss.index_factory(dim, description,
+                                faiss.METRIC_INNER_PRODUCT if metric == "cosine" else faiss.METRIC_L2)
+    if index_type == "hnsw":
+        index.hnsw.efConstruction = ef_construction
+    return index
+
+def prepare_vectors(index, vectors):
+    """float32 rows as the index expects them: unit length for cosine (inner product) indexes."""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        vectors = vectors.copy()  # normalize_L2 works in place
+        faiss.normalize_L2(vectors)
+    return vectors
+
+def index_layout(index):
+    """(metric, codec) of an index, as recorded in the store manifest."""
+    metric = "cosine" if index.metric_type == faiss.METRIC_INNER_PRODUCT else "l2"
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index = faiss.downcast_index(index.storage)
+    if isinstance(index, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        codec = "fp16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "int8"
+    elif isinstance(index, faiss.IndexIVFPQ):
+        codec = "pq"
+    else:
+        codec = "float32"
+    return metric, codec
+
+def index_params(index):
+    """index_type and the build parameters read back from an index, as recorded in the store manifest."""
+    index = base_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return {"index_type": "hnsw", "hnsw_m": int(index.hnsw.nb_neighbors(1))}
+    if isinstance(index, faiss.IndexIVF):
+        ivf = faiss.extract_index_ivf(index)
+        if isinstance(index, faiss.IndexIVFPQ):
+            return {"index_type": "ivf_pq", "nlist": int(ivf.nlist), "pq_m": int(index.pq.M),
+                    "pq_bits": int(index.pq.nbits)}
+        return {"index_type": "ivf_flat", "nlist": int(ivf.nlist)}
+    return {"index_type": "flat"}
+
+def train_index(index, embeddings, train_size=50000, seed=1234):
+    """Train on a seeded sample of at most train_size rows (embeddings may be a np.memmap)."""
+    if index.is_trained:
+        return
+    t_train = time.time()
+    n = len(embeddings)
+    sample = embeddings
+    if n > train_size:
+        rng = np.random.default_rng(seed)
+        sample = embeddings[np.sort(rng.choice(n, train_size, replace=False))]
+    index.train(prepare_vectors(index, sample))
+    logging.info(f"Training index on {len(sample)} vectors took {time.time() - t_train:.2f} sec")
+
+def create_index(embeddings, index_type="flat", ids=None, train_size=50000, seed=1234, **index_kwargs):
+    """Build a FAISS index of the requested type, train it on a sample of embeddings and add them all.
+
+    With ids the index is wrapped in an IndexIDMap2 and searches return those ids.
+    """
+    index = new_index(embeddings.shape[1], index_type, len(embeddings), **index_kwargs)
+    train_index(index, embeddings, train_size, seed)
+
+    embeddings = prepare_vectors(index, embeddings)
+    if ids is None:
+        index.add(embeddings)
+        return index
+    # Stable chunk ids survive incremental updates (see rag_build.update_store)
+    index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    return index
+
+def base_index(index):
+    """The index underneath an IndexIDMap/IndexIDMap2 wrapper."""
+    while isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    return index
+
+# ---------------- STREAMING BUILD ----------------
+class IndexBuilder:
+    """Add (ids, vectors) batches as they are embedded; finish() returns the IndexIDMap2.
+
+    Flat and HNSW indexes take every batch straight away. IVF variants and int8 codes can only be
+    trained once the whole corpus has been seen, so their batches are spilled to a temporary float32
+    file and trained on / added from a memory map in finish(). Either way memory stays bounded by the
+    batch size rather than the corpus.
+    """
+
+    def __init__(self, index_type="flat", index=None, spill_path=None, add_batch=8192, **index_kwargs):
+        self.index_type = index_type
+        self.index = index
+        self.index_kwargs = index_kwargs
+        self.spill_path = spill_path
+        self.add_batch = add_batch
+        self.dim = index.d if index is not None else None
+        self._spill = None
+        self._spill_ids = []
+        self.count = 0
+
+    def add(self, ids, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.count += len(ids)
+        if self.index is None and self._spill is None:
+            self.dim = vectors.shape[1]
+            if self.index_type in ("flat", "hnsw"):
+                index = new_index(self.dim, self.index_type, **self.index_kwargs)
+                if index.is_trained:
+                    self.index = faiss.IndexIDMap2(index)
+        if self.index is not None:
+            self.index.add_with_ids(prepare_vectors(self.index, vectors), ids)
+            return
+        if self._spill is None:
+            self._spill = open(self.spill_path, "wb")
+        self._spill.write(vectors.tobytes())
+        self._spill_ids.append(ids)
+
+    def finish(self):
+        if self._spill is None:
+            if self.index is None:
+                raise ValueError("No vectors were added to the index")
+            return self.index
+        self._spill.close()
+        ids = np.concatenate(self._spill_ids)
+        vectors = np.memmap(self.spill_path, dtype=np.float32, mode="r", shape=(len(ids), self.dim))
+        index = new_index(self.dim, self.index_type, len(ids), **self.index_kwargs)
+        train_index(index, vectors)
+        self.index = faiss.IndexIDMap2(index)
+        for start in range(0, len(ids), self.add_batch):
+            end = start + self.add_batch
+            self.index.add_with_ids(prepare_vectors(index, vectors[start:end]), ids[start:end])
+        del vectors
+        os.remove(self.spill_path)
+        return self.index
+
+def start_update(index, remove_ids, batch_size=8192):
+    """IndexBuilder that continues an existing IndexIDMap2 after dropping remove_ids.
+
+    Flat and IVF indexes are edited in place. HNSW graphs cannot delete nodes, so the retained
+    vectors are re-added to a fresh graph with the same storage; that still avoids re-embedding anything.
+    """
+    remove_ids = np.asarray(remove_ids, dtype=np.int64)
+    if len(remove_ids) and isinstance(base_index(index), faiss.IndexHNSW):
+        retained = faiss.vector_to_array(index.id_map)
+        retained = retained[~np.isin(retained, remove_ids)]
+        graph = faiss.clone_index(base_index(index))
+        graph.reset()  # keeps the trained quantizer of int8 storage
+        builder = IndexBuilder(index=faiss.IndexIDMap2(graph))
+        for start in range(0, len(retained), batch_size):
+            ids = retained[start:start + batch_size]
+            builder.add(ids, index.reconstruct_batch(ids))
+        return builder
+    if len(remove_ids):
+        index.remove_ids(faiss.IDSelectorBatch(remove_ids))
+    return IndexBuilder(index=index)
+
+# ---------------- SEARCH ----------------
+def search_params(index, selector=None, nprobe=None, ef_search=None):
+    """SearchParameters matching the index type, or None when nothing needs overriding."""
+    # SearchParameters defaults (nprobe=1, efSearch=16) override the index, so always fill them in
+    index = base_index(index)
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None:
+        params = faiss.SearchParametersIVF()
+        params.nprobe = nprobe or ivf.nprobe
+    elif isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW()
+        params.efSearch = ef_search or index.hnsw.efSearch
+    elif selector is None:
+        return None
+    else:
+        params = faiss.SearchParameters()
+    if selector is not None:
+        params.sel = selector
+    return params
+
+def search_index(index, q_emb, k, author_filter=None, nprobe=None, ef_search=None):
+    """Top-k search, restricted to one author's chunks when author_filter is given."""
+    selector = None
+    if author_filter is not None:
+        k = min(k, len(author_filter.ids))
+        selector = author_filter.selector
+    params = search_params(index, selector, nprobe, ef_search)
+    q_emb = prepare_vectors(index, q_emb)
+    if params is None:
+        return index.search(q_emb, k)
+    return index.search(q_emb, k, params=params)
+
+def search_many(index, requests, nprobe=None, ef_search=None):
+    """Answer [(q_emb [1, d], author_filter, k)] with one batched search per distinct (author_filter, k).
+
+    Returns one (distances, ids) row pair per request, in request order.
+    """
+    groups = {}
+    for pos, (_, author_filter, k) in enumerate(requests):
+        groups.setdefault((id(author_filter), k), []).append(pos)
+    results = [None] * len(requests)
+    for positions in groups.values():
+        _, author_filter, k = requests[positions[0]]
+        queries = np.vstack([requests[pos][0] for pos in positions])
+        D, I = search_index(index, queries, k, author_filter, nprobe, ef_search)
+        for row, pos in enumerate(positions):
+            results[pos] = (D[row], I[row])
+    return results
@@ -0,0 +1,52 @@
+"""Prompt assembly for the Ollama chat call.
+
+The fixed instructions go in a system message that is byte-identical on every request, so
+Ollama can keep its KV cache for that prefix and only prefill the context and question. The
+retrieved chunks are packed in rank order into a token budget instead of a fixed count of
+characters.
+"""
+import logging
+
+def pack_context(retrieved, count_tokens, budget):
+    """Join (text, metadata) pairs best-first until budget tokens; returns (context, tokens, chunks used).
+
+    A chunk that doesn't fit is skipped in favour of shorter lower-ranked ones, except the top
+    chunk, which is cut down to fit rather than dropped.
+    """
+    sections = [f"[{m['author']} - {m['book']}]: {d}" for d, m in retrieved]
+    if not sections:
+        return "", 0, 0
+    separator = "\n\n---\n\n"
+    sep_tokens = count_tokens([separator])[0]
+    packed, used = [], 0
+    for section, tokens in zip(sections, count_tokens(sections)):
+        cost = tokens + (sep_tokens if packed else 0)
+        if used + cost <= budget:
+            packed.append(section)
+            used += cost
+        elif not packed:
+            words = section.split(" ")
+            section = " ".join(words[:max(1, len(words) * budget // tokens)])
+            packed.append(section)
+            used = count_tokens([section])[0]
+    if len(packed) < len(sections):
+        logging.info(f"Context budget {budget} tokens: packed {len(packed)} of {len(sections)} chunks")
+    return separator.join(packed), used, len(packed)
+
+def chat_messages(system_prompt, context, question):
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Context: {context}\n\nQuestion: {question}"},
+    ]
+
+def log_generation_stats(final_chunk, ttft):
+    """Log time-to-first-token and Ollama's prefill/decode counters from the last streamed chunk."""
+    prefill_tokens = final_chunk.get("prompt_eval_count") or 0
+    prefill_sec = (final_chunk.get("prompt_eval_duration") or 0) / 1e9
+    eval_tokens = final_chunk.get("eval_count") or 0
+    eval_sec = (final_chunk.get("eval_duration") or 0) / 1e9
+    load_sec = (final_chunk.get("load_duration") or 0) / 1e9
+    logging.info(f"LLM time to first token {ttft:.2f} sec, prefill {prefill_tokens} tokens in {prefill_sec:.2f} sec, "
+                 f"generated {eval_tokens} tokens in {eval_sec:.2f} sec"
+                 + (f" ({eval_tokens / eval_sec:.1f} tok/sec)" if eval_sec else "")
+                 + (f", model load {load_sec:.2f} sec" if load_sec > 0.05 else ""))
@@ -0,0 +1,90 @@
+"""Multi-process serving: one UI process hands retrieval to N worker processes.
+
+Gradio keeps each session's queue in the process that served it, so the UI stays a single
+asyncio process; its own work is cheap coroutines and streaming. What the GIL serializes
+(embedding, FAISS/BM25 search, reranking, decoding and packing chunk text) runs in spawned
+worker processes instead. Every worker maps the same store files read-only, so N workers
+share one copy of the index and chunk text through the OS page cache.
+
+Only the UI process writes history and flags (HistoryStore's single writer thread).
+
+Hot reload: StoreWatcher notices when a rebuild swaps a new store into place (the manifest is
+written last, so a new manifest means a complete store). The UI process reopens it and bumps
+WorkerPool.version; each worker reopens the store before its next task. Requests already
+running finish on the old mapping, which stays valid after its files are replaced.
+"""
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+def _ping(delay):
+    time.sleep(delay)  # long enough that one worker can't answer every ping on its own
+    return os.getpid()
+
+class WorkerPool:
+    def __init__(self, workers, initializer=None, initargs=()):
+        self.workers = workers
+        self.version = 0  # store generation; tasks receive it as their last argument
+        self.ready = threading.Event()
+        # spawn, not fork: forking would copy the UI process's threads and held locks
+        self._executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"),
+                                             initializer=initializer, initargs=initargs)
+
+    def start(self):
+        """Launch every worker now and return once each has run the initializer."""
+        pids = set()
+        while len(pids) < self.workers:
+            futures = [self._executor.submit(_ping, 0.05) for _ in range(self.workers)]
+            pids.update(future.result() for future in futures)
+        logging.info(f"{len(pids)} serving workers ready (pids {sorted(pids)})")
+        self.ready.set()
+
+    def wait(self, timeout=None):
+        return self.ready.wait(timeout)
+
+    async def run(self, fn, *args):
+        """fn(*args, version) in a worker process."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args, self.version)
+
+    def reload(self):
+        """Workers reopen the store before their next task."""
+        self.version += 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+class StoreWatcher:
+    """Calls on_change() from a daemon thread whenever store_dir/manifest.json is replaced."""
+
+    def __init__(self, store_dir, on_change, interval=10.0):
+        self.path = os.path.join(store_dir, "manifest.json")
+        self.on_change = on_change
+        self.interval = interval
+        self.stamp = None
+
+    def _stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None  # mid-swap
+        return st.st_ino, st.st_mtime_ns
+
+    def start(self):
+        self.stamp = self._stamp()
+        threading.Thread(target=self._run, name="store-watcher", daemon=True).start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            stamp = self._stamp()
+            if stamp is None or stamp == self.stamp:
+                continue
+            self.stamp = stamp
+            try:
+                self.on_change()
+            except Exception:
+                logging.exception(f"Reloading {os.path.dirname(self.path)} failed, still serving the old store")
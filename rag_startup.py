@@ -0,0 +1,105 @@
+"""Fast startup: heavy resources load lazily or in a background warmup thread.
+
+    embedder = Lazy("embedder", lambda: SentenceTransformer(...))   # loads on first get()
+    warmup = Warmup()
+    warmup.add("embedder", embedder.get)
+    warmup.start()              # the UI can come up right away; warmup.ready flips when done
+
+Every phase is timed against process start and STARTUP.report() logs the breakdown.
+"""
+from contextlib import contextmanager
+import logging
+import threading
+import time
+
+class StartupTimer:
+    def __init__(self):
+        self.t0 = time.perf_counter()
+        self.phases = []  # (name, seconds, thread name)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.phases.append((name, time.perf_counter() - t0, threading.current_thread().name))
+
+    def mark(self, name):
+        """Record time since process start (e.g. "imports", "ui listening")."""
+        with self._lock:
+            self.phases.append((name, time.perf_counter() - self.t0, "since start"))
+
+    def report(self):
+        with self._lock:
+            lines = [f"  {name:<28} {seconds:7.2f} sec  ({where})" for name, seconds, where in self.phases]
+        logging.info("Startup timing:\n" + "\n".join(lines))
+
+# created when the app first imports this module, i.e. at the top of startup
+STARTUP = StartupTimer()
+
+class Lazy:
+    """A value built on first get(), once, even when several threads ask at the same time."""
+
+    def __init__(self, name, load):
+        self.name = name
+        self._load = load
+        self._value = None
+        self._lock = threading.Lock()
+        self.ready = threading.Event()
+
+    def get(self):
+        if not self.ready.is_set():
+            with self._lock:
+                if not self.ready.is_set():
+                    with STARTUP.phase(f"load {self.name}"):
+                        self._value = self._load()
+                    self.ready.set()
+        return self._value
+
+class Warmup:
+    """Runs startup tasks in order on one daemon thread; ready once every required task succeeded."""
+
+    def __init__(self):
+        self.tasks = []
+        self.current = None
+        self.errors = {}
+        self.done = threading.Event()
+
+    def add(self, name, fn, required=True):
+        self.tasks.append((name, fn, required))
+
+    def start(self):
+        threading.Thread(target=self._run, name="warmup", daemon=True).start()
+
+    def _run(self):
+        for name, fn, required in self.tasks:
+            self.current = name
+            try:
+                with STARTUP.phase(f"warmup {name}"):
+                    fn()
+            except Exception as e:
+                logging.exception(f"Warmup step {name} failed")
+                self.errors[name] = (e, required)
+        self.current = None
+        self.done.set()
+        STARTUP.mark("warm")
+        STARTUP.report()
+
+    @property
+    def ready(self):
+        return self.done.is_set() and not any(required for _, required in self.errors.values())
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def status(self):
+        """One-line readiness message for the UI."""
+        if not self.done.is_set():
+            return f"⏳ Warming up ({self.current or 'starting'})... questions asked now wait until the model is ready."
+        failed = [name for name, (_, required) in self.errors.items() if required]
+        if failed:
+            return f"❌ Startup failed: {', '.join(failed)}. Check the server logs."
+        return "✅ Ready"
@@ -0,0 +1,350 @@
+"""Versioned, memory-mapped on-disk layout for the RAG store.
+
+    <store>/manifest.json      format version, counts and the author/book/file vocabularies
+    <store>/sources.json       per source file: size, mtime, sha256 and its chunk id range
+    <store>/index.faiss        FAISS IndexIDMap2 written with faiss.write_index
+    <store>/chunk_ids.npy      int64[N] stable chunk id of each row, ascending
+    <store>/chunks.bin         every chunk's UTF-8 text, back to back
+    <store>/chunk_offsets.npy  int64[N+1] byte offsets of each chunk in the (uncompressed) text
+    <store>/chunks.zst         instead of chunks.bin with text_codec "zstd": one zstd frame per
+    <store>/chunk_blocks.npy   block of BLOCK_CHUNKS chunks, at these int64[B+1] byte offsets
+    <store>/author.npy         int32[N] codes into manifest["authors"]   (same for book.npy / file.npy)
+    <store>/author_ids.npy     chunk ids grouped by author, sliced by author_offsets.npy
+    <store>/bm25*              BM25 inverted index over the chunk text (see bm25.py)
+
+<store> itself is a symlink to the current <store>.v<N> directory. A rebuild writes <store>.tmp,
+renames it to the next version and atomically replaces the symlink, so <store> always names a
+complete store, even if the process dies mid-swap (recover_store repairs a missing link).
+
+Chunk ids are stable across incremental updates (rag_build.update_store): FAISS returns them,
+and docs[chunk_id] / metadata[chunk_id] map them back to rows with a binary search.
+
+Everything is opened read-only with mmap, so loading does no per-chunk work and several
+server processes share the same pages through the OS page cache. Compressed text is only
+decompressed a block at a time for the chunks a query actually returns.
+
+Convert an old pickle store with: python rag_store.py faiss_store_author.pkl faiss_store_author
+"""
+from array import array
+from collections import OrderedDict
+import json
+import logging
+import mmap
+import os
+import re
+import shutil
+import sys
+import threading
+import time
+
+import faiss
+import numpy as np
+
+from bm25 import BM25Builder
+from rag_index import build_author_filters, create_index, index_layout, index_params
+
+FORMAT_VERSION = 2
+COLUMNS = ("author", "book", "file")
+# Zero-copy mmap of the index codes where this FAISS build supports it
+MMAP_FLAG = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+TEXT_CODECS = ("raw", "zstd")
+BLOCK_CHUNKS = 64   # chunks per zstd frame: bigger compresses better, smaller decompresses less per hit
+
+# ---------------- READ SIDE ----------------
+def rows_of(chunk_ids, ids):
+    """Row positions of stable chunk ids (chunk_ids is sorted ascending)."""
+    return np.searchsorted(chunk_ids, ids)
+
+class ChunkStore:
+    """Chunk strings by stable chunk id, backed by the mmapped chunks.bin blob."""
+
+    def __init__(self, blob_path, offsets_path, chunk_ids):
+        self.offsets = np.load(offsets_path, mmap_mode="r")
+        self.chunk_ids = chunk_ids
+        self._file = open(blob_path, "rb")
+        # mmap refuses empty files
+        size = os.fstat(self._file.fileno()).st_size
+        self._blob = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, chunk_id):
+        return self.at(rows_of(self.chunk_ids, chunk_id))
+
+    def at(self, row):
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self._blob[start:end].decode("utf-8")
+
+class ZstdChunkStore(ChunkStore):
+    """ChunkStore over chunks.zst; keeps the last few decompressed blocks."""
+
+    def __init__(self, blob_path, offsets_path, blocks_path, chunk_ids, block_chunks, cached_blocks=8):
+        import zstandard
+
+        super().__init__(blob_path, offsets_path, chunk_ids)
+        self.blocks = np.load(blocks_path, mmap_mode="r")
+        self.block_chunks = block_chunks
+        self.cached_blocks = cached_blocks
+        self._decompressor = zstandard.ZstdDecompressor()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _block(self, block):
+        with self._lock:
+            data = self._cache.get(block)
+            if data is None:
+                data = self._decompressor.decompress(self._blob[self.blocks[block]:self.blocks[block + 1]])
+                self._cache[block] = data
+                if len(self._cache) > self.cached_blocks:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(block)
+            return data
+
+    def at(self, row):
+        block = int(row) // self.block_chunks
+        base = self.offsets[block * self.block_chunks]
+        return self._block(block)[self.offsets[row] - base:self.offsets[row + 1] - base].decode("utf-8")
+
+class MetadataColumns:
+    """{"author", "book", "file"} dicts by stable chunk id, decoded from int32 code columns."""
+
+    def __init__(self, store_dir, manifest, chunk_ids):
+        self.chunk_ids = chunk_ids
+        self.vocab = {col: manifest[col + "s"] for col in COLUMNS}
+        self.codes = {col: np.load(os.path.join(store_dir, col + ".npy"), mmap_mode="r") for col in COLUMNS}
+        self.authors = self.vocab["author"]
+
+    def __len__(self):
+        return len(self.codes["author"])
+
+    def __getitem__(self, chunk_id):
+        return self.at(rows_of(self.chunk_ids, chunk_id))
+
+    def at(self, row):
+        return {col: self.vocab[col][self.codes[col][row]] for col in COLUMNS}
+
+def read_manifest(store_dir):
+    with open(os.path.join(store_dir, "manifest.json"), "r", encoding="utf-8") as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != FORMAT_VERSION:
+        raise ValueError(f"Unsupported store format {manifest.get('format_version')} in {store_dir}, "
+                         f"expected {FORMAT_VERSION}. Rebuild the index.")
+    return manifest
+
+def read_sources(store_dir):
+    """relative source path -> {"size", "mtime_ns", "sha256", "first_id", "count"}; empty for a new store."""
+    path = os.path.join(store_dir, "sources.json")
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def write_sources(store_dir, sources):
+    """Replace sources.json in an existing store atomically."""
+    path = os.path.join(store_dir, "sources.json")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(sources, f, ensure_ascii=False)
+    os.replace(path + ".tmp", path)
+
+def load_store(store_dir):
+    """Open a store directory: (index, docs, metadata, author_filters), all backed by mmap."""
+    recover_store(store_dir)
+    manifest = read_manifest(store_dir)
+    index = faiss.read_index(os.path.join(store_dir, "index.faiss"), MMAP_FLAG)
+    chunk_ids = np.load(os.path.join(store_dir, "chunk_ids.npy"), mmap_mode="r")
+    if manifest.get("text_codec", "raw") == "zstd":
+        docs = ZstdChunkStore(os.path.join(store_dir, "chunks.zst"), os.path.join(store_dir, "chunk_offsets.npy"),
+                              os.path.join(store_dir, "chunk_blocks.npy"), chunk_ids, manifest["block_chunks"])
+    else:
+        docs = ChunkStore(os.path.join(store_dir, "chunks.bin"), os.path.join(store_dir, "chunk_offsets.npy"), chunk_ids)
+    metadata = MetadataColumns(store_dir, manifest, chunk_ids)
+
+    author_ids = np.load(os.path.join(store_dir, "author_ids.npy"), mmap_mode="r")
+    author_offsets = np.load(os.path.join(store_dir, "author_offsets.npy"))
+    slices = {}
+    for code, author in enumerate(manifest["authors"]):
+        slices.setdefault(author.lower(), []).append(author_ids[author_offsets[code]:author_offsets[code + 1]])
+    # folders that differ only in case are one author, as in build_author_index
+    author_index = {author: parts[0] if len(parts) == 1 else np.sort(np.concatenate(parts))
+                    for author, parts in slices.items()}
+    return index, docs, metadata, build_author_filters(author_index)
+
+# ---------------- WRITE SIDE ----------------
+def version_path(store_dir, version):
+    return f"{os.path.normpath(store_dir)}.v{version}"
+
+def store_versions(store_dir):
+    """(N, path) of every <store>.v<N> directory, oldest first."""
+    parent = os.path.dirname(os.path.abspath(store_dir))
+    pattern = re.compile(re.escape(os.path.basename(os.path.normpath(store_dir))) + r"\.v(\d+)$")
+    found = [(int(m.group(1)), os.path.join(parent, name))
+             for name in os.listdir(parent) if (m := pattern.match(name))]
+    return sorted(found)
+
+def _point_at(store_dir, version_dir):
+    # a new symlink renamed over the old one: readers see either the old or the new store
+    link = os.path.normpath(store_dir) + ".link"
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version_dir), link)
+    os.replace(link, os.path.normpath(store_dir))
+
+def recover_store(store_dir):
+    """Re-link store_dir to the newest complete version if a crash mid-swap left it missing."""
+    if os.path.exists(store_dir):
+        return
+    complete = [path for _, path in store_versions(store_dir)
+                if os.path.exists(os.path.join(path, "manifest.json"))]
+    legacy = os.path.normpath(store_dir) + ".old"  # left by the old two-rename swap
+    if not complete and os.path.exists(os.path.join(legacy, "manifest.json")):
+        complete = [version_path(store_dir, 0)]
+        os.replace(legacy, complete[0])
+    if complete:
+        logging.warning(f"{store_dir} was missing, recovering {complete[-1]}")
+        _point_at(store_dir, complete[-1])
+
+def swap_into_place(tmp_dir, store_dir):
+    """Publish tmp_dir as the next <store>.v<N> and switch the store_dir symlink to it."""
+    recover_store(store_dir)
+    if os.path.isdir(store_dir) and not os.path.islink(store_dir):
+        # a store from before versioned directories becomes version 0 (recover_store finds it)
+        os.replace(store_dir, version_path(store_dir, 0))
+    versions = store_versions(store_dir)
+    version_dir = version_path(store_dir, versions[-1][0] + 1 if versions else 1)
+    os.replace(tmp_dir, version_dir)
+    _point_at(store_dir, version_dir)
+    # processes still mapping an old version keep its pages after the files are unlinked
+    for _, path in versions:
+        shutil.rmtree(path, ignore_errors=True)
+
+class StoreWriter:
+    """Stream chunks into <store>.tmp in ascending chunk id order; commit() swaps it into place.
+
+    Chunk text goes straight to chunks.bin (or, with text_codec "zstd", to chunks.zst a block at a
+    time), so memory only holds a few integers per chunk.
+    """
+
+    def __init__(self, store_dir, text_codec="raw", block_chunks=BLOCK_CHUNKS):
+        if text_codec not in TEXT_CODECS:
+            raise ValueError(f"Unknown text codec '{text_codec}', expected one of {TEXT_CODECS}")
+        self.store_dir = store_dir
+        self.tmp_dir = store_dir + ".tmp"
+        if os.path.exists(self.tmp_dir):
+            shutil.rmtree(self.tmp_dir)
+        os.makedirs(self.tmp_dir)
+        self.text_codec = text_codec
+        self.block_chunks = block_chunks
+        self._compressor = None
+        if text_codec == "zstd":
+            import zstandard
+
+            self._compressor = zstandard.ZstdCompressor(level=9)
+            self._pending = []
+            self.blocks = array("q", [0])
+        self._blob = open(os.path.join(self.tmp_dir, "chunks.zst" if self._compressor else "chunks.bin"), "wb")
+        self.offsets = array("q", [0])
+        self.chunk_ids = array("q")
+        self.codes = {col: array("i") for col in COLUMNS}
+        self.vocab = {col: {} for col in COLUMNS}
+        self.bm25 = BM25Builder()
+
+    def __len__(self):
+        return len(self.chunk_ids)
+
+    def add(self, chunk_id, text, meta):
+        data = text.encode("utf-8")
+        self.offsets.append(self.offsets[-1] + len(data))
+        self.chunk_ids.append(chunk_id)
+        if self._compressor is None:
+            self._blob.write(data)
+        else:
+            self._pending.append(data)
+            if len(self._pending) == self.block_chunks:
+                self._write_block()
+        self.bm25.add(text)
+        for col in COLUMNS:
+            vocab = self.vocab[col]
+            self.codes[col].append(vocab.setdefault(meta[col], len(vocab)))
+
+    def _write_block(self):
+        frame = self._compressor.compress(b"".join(self._pending))
+        self._blob.write(frame)
+        self.blocks.append(self.blocks[-1] + len(frame))
+        self._pending = []
+
+    def abort(self):
+        self._blob.close()
+        shutil.rmtree(self.tmp_dir, ignore_errors=True)
+
+    def commit(self, index, sources, next_chunk_id):
+        t0 = time.time()
+        tmp_dir = self.tmp_dir
+        if self._compressor is not None:
+            if self._pending:
+                self._write_block()
+            np.save(os.path.join(tmp_dir, "chunk_blocks.npy"), np.frombuffer(self.blocks, dtype=np.int64))
+        self._blob.close()
+        faiss.write_index(index, os.path.join(tmp_dir, "index.faiss"))
+        chunk_ids = np.frombuffer(self.chunk_ids, dtype=np.int64)
+        np.save(os.path.join(tmp_dir, "chunk_ids.npy"), chunk_ids)
+        np.save(os.path.join(tmp_dir, "chunk_offsets.npy"), np.frombuffer(self.offsets, dtype=np.int64))
+        write_sources(tmp_dir, sources)
+        self.bm25.write(tmp_dir)
+
+        metric, codec = index_layout(index)
+        manifest = {"format_version": FORMAT_VERSION, "count": len(chunk_ids), "dim": index.d,
+                    "next_chunk_id": int(next_chunk_id), **index_params(index), "metric": metric,
+                    "codec": codec, "text_codec": self.text_codec}
+        if self._compressor is not None:
+            manifest["block_chunks"] = self.block_chunks
+        for col in COLUMNS:
+            # Re-number codes so the vocabulary is sorted (get_authors relies on it)
+            vocab = sorted(self.vocab[col])
+            remap = np.empty(len(vocab), dtype=np.int32)
+            for code, value in enumerate(vocab):
+                remap[self.vocab[col][value]] = code
+            codes = remap[np.frombuffer(self.codes[col], dtype=np.int32)]
+            manifest[col + "s"] = vocab
+            np.save(os.path.join(tmp_dir, col + ".npy"), codes)
+            if col == "author":
+                author_rows = np.argsort(codes, kind="stable")
+                author_offsets = np.searchsorted(codes[author_rows], np.arange(len(vocab) + 1)).astype(np.int64)
+                np.save(os.path.join(tmp_dir, "author_ids.npy"), chunk_ids[author_rows])
+                np.save(os.path.join(tmp_dir, "author_offsets.npy"), author_offsets)
+
+        # manifest last: a directory without one is never a valid store
+        with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=1)
+
+        swap_into_place(tmp_dir, self.store_dir)
+        logging.info(f"Saving store to {self.store_dir} took {time.time() - t0:.2f} sec")
+
+def save_store(store_dir, index, documents, metadata_list, chunk_ids, sources, next_chunk_id, text_codec="raw"):
+    """Write a whole store at once; documents and metadata_list are in chunk_ids order."""
+    writer = StoreWriter(store_dir, text_codec)
+    for chunk_id, doc, meta in zip(chunk_ids, documents, metadata_list):
+        writer.add(chunk_id, doc, meta)
+    writer.commit(index, sources, next_chunk_id)
+
+def convert_pickle_store(pickle_file, store_dir):
+    """One-off migration from the old faiss_store_author.pkl.
+
+    Pickles never recorded their source files, so the first update after converting re-embeds everything.
+    """
+    import pickle
+
+    with open(pickle_file, "rb") as f:
+        index, documents, metadata_list = pickle.load(f)[:3]
+    chunk_ids = np.arange(len(documents), dtype=np.int64)
+    # pickled stores always held an IndexFlatL2
+    id_index = create_index(index.reconstruct_n(0, index.ntotal), "flat", ids=chunk_ids)
+    save_store(store_dir, id_index, documents, metadata_list, chunk_ids, {}, len(documents))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    if len(sys.argv) != 3:
+        sys.exit("usage: python rag_store.py <old_store.pkl> <new_store_dir>")
+    convert_pickle_store(sys.argv[1], sys.argv[2])
+    print(f"✅ Converted {sys.argv[1]} to {sys.argv[2]}")
@@ -0,0 +1,68 @@
+"""Optional rerank stage between retrieval and context building.
+
+A cross-encoder reads the question and each candidate chunk together, which orders the top few
+much better than embedding distance or rank fusion, but costs a transformer pass per pair. So
+the stage scores at most max_candidates pairs in one batch, caches (question, chunk id) scores,
+and keeps to a latency budget: from the measured seconds per pair it only scores as many
+uncached candidates as fit in budget_ms, and skips reranking when fewer than two would.
+"""
+import logging
+import time
+
+from query_cache import LRUCache, normalize_question
+
+class Reranker:
+    def __init__(self, score_pairs, max_candidates=20, budget_ms=250, cache_size=20000, cache_ttl=3600):
+        self.score_pairs = score_pairs  # list of (question, chunk text) -> list of relevance scores
+        self.max_candidates = max_candidates
+        self.budget = budget_ms / 1000.0
+        self.scores = LRUCache(cache_size, cache_ttl)
+        self.sec_per_pair = None  # moving average of scoring cost
+        self.reranked = self.skipped = 0
+
+    def _affordable(self, n_missing):
+        if self.sec_per_pair is None:
+            return n_missing  # first call measures
+        return min(n_missing, int(self.budget / self.sec_per_pair))
+
+    def rerank(self, question, chunk_ids, text_of, k, generation=0):
+        """Best k of chunk_ids (in retrieval order) by cross-encoder score; text_of(chunk_id) -> text.
+
+        generation names the store chunk_ids belong to, so scores never carry over to a rebuilt one.
+        """
+        candidates = list(chunk_ids)[:self.max_candidates]
+        if len(candidates) <= 1:
+            return candidates[:k]
+        key = (generation, normalize_question(question))
+        scores = {cid: self.scores.get((key, cid)) for cid in candidates}
+        missing = [cid for cid in candidates if scores[cid] is None]
+
+        n_score = self._affordable(len(missing))
+        if n_score < len(missing):
+            # over budget: score the highest-ranked uncached candidates and leave out the rest
+            left_out = set(missing[n_score:])
+            candidates = [cid for cid in candidates if cid not in left_out]
+            missing = missing[:n_score]
+            if len(candidates) <= 1:
+                self.skipped += 1
+                # drift back down so a transient slowdown doesn't disable reranking for good
+                self.sec_per_pair *= 0.9
+                logging.info(f"Rerank skipped: ~{self.sec_per_pair * 1000:.1f} ms per pair exceeds the budget")
+                return list(chunk_ids)[:k]
+
+        if missing:
+            t_score = time.time()
+            new_scores = self.score_pairs([(question, text_of(cid)) for cid in missing])
+            per_pair = (time.time() - t_score) / len(missing)
+            self.sec_per_pair = per_pair if self.sec_per_pair is None else 0.8 * self.sec_per_pair + 0.2 * per_pair
+            for cid, score in zip(missing, new_scores):
+                scores[cid] = float(score)
+                self.scores.put((key, cid), float(score))
+            logging.info(f"Rerank scored {len(missing)} pairs in {time.time() - t_score:.3f} sec "
+                         f"({len(candidates) - len(missing)} cached)")
+        self.reranked += 1
+        return sorted(candidates, key=lambda cid: scores[cid], reverse=True)[:k]
+
+    def stats(self):
+        return {"reranked": self.reranked, "skipped": self.skipped,
+                "score_cache": {"hits": self.scores.hits, "misses": self.scores.misses, "size": len(self.scores)}}
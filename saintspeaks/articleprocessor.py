@@ -1,26 +1,61 @@
-def process_file(input_file, output_file):
-    try:
-        with open(input_file, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+"""Quote article lines for the app's assets, in batch.
+
+    python articleprocessor.py                                 # article.txt -> processed_article.txt
+    python articleprocessor.py articles/ 'more/**/*.txt' --out-dir processed --workers 8
+    python articleprocessor.py articles/ --chunks-dir "../App Books" --author "Swami Vivekananda"
+
+Inputs are files, directories (every .txt below them) or glob patterns. Each file is streamed
+line by line into processed_<name>, files run in a process pool, and a manifest of content
+hashes skips files that are unchanged since the last run with the same settings (--force redoes
+them).
 
-        processed_lines = []
-        for line in lines:
-            line = line.strip()
-            # Escape single quotes inside the line
-            line = line.replace("'", r"\'")
+--chunks-dir also writes <chunks-dir>/<author>/<name>.chunks.jsonl: the article cut by the same
+SentenceChunker the index build uses, sized in the embedder's tokens. rag_build picks these files
+up like any other source under the books folder and embeds the chunks as they are.
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
 
-            # Wrap in single quotes if not already wrapped
-            if not (line.startswith("'") and line.endswith("'")):
-                line = f"'{line}'"
+OUTPUT_PREFIX = "processed_"
+CHUNK_FILE_SUFFIX = ".chunks.jsonl"  # rag_build.CHUNK_FILE_SUFFIX
+EMBED_MODEL = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"  # the apps' EMBED_MODEL
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-            processed_lines.append(line)
+def quote_line(line):
+    line = line.strip()
+    # Escape single quotes inside the line
+    line = line.replace("'", r"\'")
 
-        # Join with literal \n\n between lines (not in quotes)
-        final_text = r"\n\n".join(processed_lines)
+    # Wrap in single quotes if not already wrapped
+    if not (line.startswith("'") and line.endswith("'")):
+        line = f"'{line}'"
+    return line
 
-        with open(output_file, "w", encoding="utf-8") as f:
-            f.write(final_text)
+def convert(input_file, output_file, keep_lines=False):
+    """Stream input_file into output_file; returns (line count, the stripped lines if keep_lines)."""
+    count, kept = 0, [] if keep_lines else None
+    tmp = output_file + ".tmp"
+    with open(input_file, "r", encoding="utf-8") as src, open(tmp, "w", encoding="utf-8") as dst:
+        for line in src:
+            # Join with literal \n\n between lines (not in quotes)
+            if count:
+                dst.write(r"\n\n")
+            dst.write(quote_line(line))
+            if kept is not None:
+                kept.append(line.strip())
+            count += 1
+    os.replace(tmp, output_file)
+    return count, kept
 
+def process_file(input_file, output_file):
+    try:
+        convert(input_file, output_file)
         print(f"✅ Processed file saved as: {output_file}")
 
     except FileNotFoundError:
@@ -28,8 +63,178 @@ def process_file(input_file, output_file):
     except Exception as e:
         print(f"❌ An error occurred: {e}")
 
+# ---------------- CHUNKS ----------------
+_chunker = None
+
+def get_chunker(model_name, max_tokens, overlap_tokens):
+    """SentenceChunker counting tokens with model_name's tokenizer, loaded once per process."""
+    global _chunker
+    if _chunker is None:
+        sys.path.insert(0, REPO_ROOT)
+        from transformers import AutoTokenizer
+        from chunker import SentenceChunker, tokenizer_counter
+
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        _chunker = SentenceChunker(tokenizer_counter(tokenizer), max_tokens, overlap_tokens)
+    return _chunker
+
+def write_chunks(chunks_file, chunks, author, book):
+    os.makedirs(os.path.dirname(chunks_file) or ".", exist_ok=True)
+    tmp = chunks_file + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        for chunk in chunks:
+            f.write(json.dumps({"text": chunk, "author": author, "book": book, "file": book},
+                               ensure_ascii=False) + "\n")
+    os.replace(tmp, chunks_file)
+
+# ---------------- BATCH ----------------
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def find_inputs(patterns):
+    """Article files named by paths, directories (recursive .txt) or globs, without our own outputs."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            for root, _, files in os.walk(pattern):
+                found.extend(os.path.join(root, f) for f in files if f.endswith(".txt"))
+        elif os.path.isfile(pattern):
+            found.append(pattern)
+        else:
+            found.extend(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+    inputs = {os.path.normpath(p) for p in found
+              if not os.path.basename(p).startswith(OUTPUT_PREFIX) and not p.endswith((".tmp", CHUNK_FILE_SUFFIX))}
+    return sorted(inputs)
+
+def run_job(job):
+    """Process one article unless its manifest entry says it is unchanged; returns its summary row."""
+    t0 = time.perf_counter()
+    src, recorded, settings = job["input"], job["recorded"], job["settings"]
+    outputs = [p for p in (job["output"], job["chunks"]) if p]
+    row = {"input": src, "status": "skipped", "lines": 0, "chunks": 0, "bytes": 0}
+    try:
+        st = os.stat(src)
+        stat = {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+        current = recorded and recorded.get("settings") == settings and all(map(os.path.exists, outputs))
+        if current and all(recorded.get(key) == value for key, value in stat.items()):
+            row["entry"] = recorded  # size and mtime unchanged: not even hashed
+            return row
+        digest = file_sha256(src)
+        if current and recorded.get("sha256") == digest:
+            row["entry"] = {**recorded, **stat}  # touched, same content
+            return row
+
+        os.makedirs(os.path.dirname(job["output"]) or ".", exist_ok=True)
+        lines, kept = convert(src, job["output"], keep_lines=bool(job["chunks"]))
+        chunks = 0
+        if job["chunks"]:
+            chunk_list = get_chunker(*job["chunker"])("\n\n".join(line for line in kept if line))
+            write_chunks(job["chunks"], chunk_list, job["author"], os.path.basename(src))
+            chunks = len(chunk_list)
+        row.update(status="processed", lines=lines, chunks=chunks, bytes=st.st_size,
+                   entry={**stat, "sha256": digest, "settings": settings, "outputs": outputs})
+    except Exception as e:
+        row.update(status="error", error=str(e))
+    finally:
+        row["seconds"] = time.perf_counter() - t0
+    return row
+
+def load_manifest(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_manifest(path, manifest):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+def plan_jobs(inputs, args):
+    """One job per input, with output paths mirroring the inputs' layout under --out-dir/--chunks-dir."""
+    base = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in inputs])
+    settings = {"quote": 1}
+    if args.chunks_dir:
+        settings.update(author=args.author, model=args.model, chunk_tokens=args.chunk_tokens,
+                        overlap_tokens=args.overlap_tokens)
+    settings = json.dumps(settings, sort_keys=True)
+    manifest = {} if args.force else load_manifest(args.manifest)
+    jobs = []
+    for src in inputs:
+        rel_dir = os.path.relpath(os.path.dirname(os.path.abspath(src)), base)
+        name = os.path.basename(src)
+        out_dir = os.path.join(args.out_dir, rel_dir) if args.out_dir else os.path.dirname(src)
+        chunks = None
+        if args.chunks_dir:
+            chunks = os.path.join(args.chunks_dir, args.author, rel_dir, os.path.splitext(name)[0] + CHUNK_FILE_SUFFIX)
+        jobs.append({"input": src, "output": os.path.normpath(os.path.join(out_dir, OUTPUT_PREFIX + name)),
+                     "chunks": chunks and os.path.normpath(chunks), "author": args.author,
+                     "chunker": (args.model, args.chunk_tokens, args.overlap_tokens),
+                     "settings": settings, "recorded": manifest.get(os.path.abspath(src))})
+    return jobs
+
+def run_batch(jobs, workers):
+    """Yield summary rows as files finish."""
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield run_job(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for future in as_completed([pool.submit(run_job, job) for job in jobs]):
+            yield future.result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Quote article lines for the app's assets, optionally chunking them for the RAG index")
+    parser.add_argument("inputs", nargs="*", default=["article.txt"], help="files, directories or glob patterns")
+    parser.add_argument("--out-dir", help="write processed_<name> here instead of next to each input")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--manifest", default=".articleprocessor.json", help="content hashes of processed inputs")
+    parser.add_argument("--force", action="store_true", help="reprocess unchanged files too")
+    parser.add_argument("--chunks-dir", help="also write <author>/<name>.chunks.jsonl here (the RAG books folder)")
+    parser.add_argument("--author", default="Unknown", help="author recorded with the chunks")
+    parser.add_argument("--model", default=EMBED_MODEL, help="tokenizer the chunks are sized with")
+    parser.add_argument("--chunk-tokens", type=int, default=126, help="the embedder's max sequence length minus 2")
+    parser.add_argument("--overlap-tokens", type=int, default=24)
+    args = parser.parse_args()
+
+    inputs = find_inputs(args.inputs)
+    if not inputs:
+        print("❌ Error: Input file not found.")
+        return 1
+    jobs = plan_jobs(inputs, args)
+    manifest = load_manifest(args.manifest)
+
+    t0 = time.perf_counter()
+    rows = []
+    for row in run_batch(jobs, args.workers):
+        rows.append(row)
+        if row["status"] == "error":
+            print(f"❌ {row['input']}: {row['error']}")
+        elif row["status"] == "skipped":
+            print(f"⏭️  {row['input']}: unchanged")
+        else:
+            print(f"✅ {row['input']}: {row['lines']} lines, {row['chunks']} chunks, "
+                  f"{row['bytes'] / 1024:.1f} KB in {row['seconds'] * 1000:.0f} ms")
+        if "entry" in row:
+            manifest[os.path.abspath(row["input"])] = row["entry"]
+    elapsed = time.perf_counter() - t0
+    save_manifest(args.manifest, manifest)
+
+    done = [r for r in rows if r["status"] == "processed"]
+    counts = {status: sum(r["status"] == status for r in rows) for status in ("processed", "skipped", "error")}
+    mb = sum(r["bytes"] for r in done) / 1e6
+    print(f"📊 {counts['processed']} processed, {counts['skipped']} unchanged, {counts['error']} failed "
+          f"in {elapsed:.2f} s with {min(args.workers, len(jobs))} workers: "
+          f"{len(done) / elapsed:.1f} files/s, {sum(r['lines'] for r in done) / elapsed:.0f} lines/s, "
+          f"{mb / elapsed:.2f} MB/s, {sum(r['chunks'] for r in done)} chunks")
+    return 1 if counts["error"] else 0
+
 
 if __name__ == "__main__":
-    input_file = 'article.txt'
-    output_file = "processed_" + input_file
-    process_file(input_file, output_file)
+    sys.exit(main())